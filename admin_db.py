@@ -1,41 +1,62 @@
 import sqlite3
-from contextlib import contextmanager
 from typing import Optional, List, Dict, Any
+from sqlite_pool import ConnectionManager
+from migrations import Migration, migrate
 
 ADMIN_DB_NAME = 'admin.db'
 
-@contextmanager
+_connections = ConnectionManager(lambda: ADMIN_DB_NAME)
+
+
 def get_admin_db_connection():
-    conn = sqlite3.connect(ADMIN_DB_NAME)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
-
-def init_db():
-    with get_admin_db_connection() as conn:
-        c = conn.cursor()
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS faqs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question TEXT NOT NULL,
-            answer TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS rewards (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT NOT NULL,
-            cost REAL NOT NULL,
-            image_url TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )''')
+    return _connections.transaction()
+
+
+def transaction(immediate: bool = False):
+    return _connections.transaction(immediate)
+
+def _migrate_base_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS faqs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        question TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS rewards (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT NOT NULL,
+        cost REAL NOT NULL,
+        image_url TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    c.execute('CREATE INDEX IF NOT EXISTS idx_faqs_created ON faqs(created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_rewards_cost ON rewards(cost)')
+
+def _migrate_change_versions(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS change_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )''')
+    for table in ('faqs', 'rewards'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+            AFTER {event} ON {table}
+            BEGIN
+                INSERT INTO change_versions (name, version) VALUES ('{table}', 1)
+                ON CONFLICT(name) DO UPDATE SET version = version + 1;
+            END''')
+
+# 1-2 also adopt databases created before versioning, so they stay idempotent
+MIGRATIONS = [
+    Migration(1, 'faqs and rewards', _migrate_base_tables),
+    Migration(2, 'change versions', _migrate_change_versions),
+]
+
+def init_db() -> List[str]:
+    return migrate(transaction, MIGRATIONS)
 
 def create_faq(question: str, answer: str) -> int:
     with get_admin_db_connection() as conn:
@@ -91,4 +112,11 @@ def delete_reward(reward_id: int) -> bool:
     with get_admin_db_connection() as conn:
         c = conn.cursor()
         c.execute('DELETE FROM rewards WHERE id = ?', (reward_id,))
-        return c.rowcount > 0
\ No newline at end of file
+        return c.rowcount > 0
+
+def get_change_version(name: str) -> int:
+    with get_admin_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT version FROM change_versions WHERE name = ?', (name,))
+        result = c.fetchone()
+        return result[0] if result else 0
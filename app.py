@@ -1,24 +1,43 @@
 import os
-from flask import Flask, render_template, redirect, request, session, jsonify, url_for, send_from_directory
+from flask import Flask, render_template, redirect, request, session, jsonify, url_for, send_from_directory, g
 from urllib.parse import urlparse
 import requests
+import http_client
 from datetime import timedelta
 import db
 import admin_db
+import catalog
 import slack
+import outbox
+import hackatime
+import hour_sync
+import metrics
+import events
+import images
+import cooperative
+import oidc
+import sessions
 from dotenv import load_dotenv
 import json
+import base64
 from pathlib import Path
 from werkzeug.utils import secure_filename
-import uuid
+import csv
+import io
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import click
 
 load_dotenv()
 
 app = Flask(__name__)
-app.secret_key = os.getenv("APP_SECRET", os.urandom(24))
+# Without APP_SECRET, workers share a generated key kept next to users.db (see configure())
+app.secret_key = os.getenv("APP_SECRET")
+SECRET_KEY_FILE = os.getenv("APP_SECRET_FILE")
 
 UPLOAD_FOLDER = Path(__file__).parent / "static" / "uploads"
-UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 app.config['UPLOAD_FOLDER'] = str(UPLOAD_FOLDER)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
@@ -28,10 +47,14 @@ def allowed_file(filename):
 
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-AUTH_URL = "https://auth.hackclub.com/oauth/authorize"
-TOKEN_URL = "https://auth.hackclub.com/oauth/token"
-JWKS_URL = "https://auth.hackclub.com/oauth/discovery/keys"
-USERINFO_URL = "https://auth.hackclub.com/oauth/userinfo"
+AUTH_BASE_URL = os.getenv("AUTH_BASE_URL", "https://auth.hackclub.com").rstrip("/")
+AUTH_URL = f"{AUTH_BASE_URL}/oauth/authorize"
+TOKEN_URL = f"{AUTH_BASE_URL}/oauth/token"
+JWKS_URL = f"{AUTH_BASE_URL}/oauth/discovery/keys"
+USERINFO_URL = f"{AUTH_BASE_URL}/oauth/userinfo"
+OIDC_ISSUER = os.getenv("OIDC_ISSUER", AUTH_BASE_URL)
+# Login reads these from the ID token and only calls userinfo if one is missing
+ID_TOKEN_CLAIMS = ("email", "slack_id", "verification_status", "ysws_eligible")
 
 # Load Config
 DEFAULT_SITE_CONFIG = {
@@ -73,31 +96,199 @@ def load_site_config():
         config_path.write_text(json.dumps(DEFAULT_SITE_CONFIG, indent=2))
         return DEFAULT_SITE_CONFIG
    
-SITE_CONFIG = load_site_config()
+SITE_CONFIG = DEFAULT_SITE_CONFIG
+ADMIN_IDS = frozenset()
+REVIEWER_IDS = frozenset()
+# Identifies the role lists the role bits in a session were resolved against
+ROLE_KEY = ""
+SESSION_KEY = "auth"
+# Written by logins before session payloads were versioned
+LEGACY_SESSION_KEYS = ("user_id", "email", "slack_id", "nickname")
+
+# Request metrics (wall/SQLite/upstream timings, /metrics, Server-Timing)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Importing this module has no side effects. prepare() does the one-time setup
+# (config file, upload folder, schema and migrations) and must finish before any
+# worker starts; create_app() does the per-process setup. See wsgi.py and gunicorn.conf.py.
+_app_ready = False
+_app_lock = threading.Lock()
+_leader_lock = None
+LEADER_RETRY_SECONDS = 5
+
+
+def prepare():
+    # Returns the migrations applied, as "<database>: <name>"
+    UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
+    load_site_config()
+    if not app.secret_key:
+        sessions.load_secret_key(secret_key_file())
+    applied = [f"{db.DB_NAME}: {name}" for name in db.init_db()]
+    applied += [f"{admin_db.ADMIN_DB_NAME}: {name}" for name in admin_db.init_db()]
+    return applied
+
+
+def secret_key_file():
+    return SECRET_KEY_FILE or f"{db.DB_NAME}.secret"
+
+
+def configure():
+    global SITE_CONFIG, ADMIN_IDS, REVIEWER_IDS, ROLE_KEY
+    SITE_CONFIG = load_site_config()
+    ADMIN_IDS = frozenset(SITE_CONFIG.get("admin_slacks", []))
+    REVIEWER_IDS = frozenset(SITE_CONFIG.get("reviewer_slacks", []))
+    ROLE_KEY = hashlib.sha256(json.dumps([sorted(ADMIN_IDS), sorted(REVIEWER_IDS)]).encode()).hexdigest()[:12]
+    if not app.secret_key:
+        app.secret_key = sessions.load_secret_key(secret_key_file())
+    # Under a gevent worker, SQLite calls move to native threads (no-op otherwise)
+    cooperative.offload_module(db, context_managers={"get_db_connection", "transaction"})
+    cooperative.offload_module(admin_db, context_managers={"get_admin_db_connection", "transaction"})
+    if METRICS_ENABLED:
+        metrics.install()
+        metrics.instrument_module(db)
+        metrics.instrument_module(admin_db)
+        metrics.name_upstream(hackatime.STATS_URL, "hackatime")
+        metrics.name_upstream(slack.SLACK_API_URL, "slack")
+        metrics.name_upstream(AUTH_BASE_URL, "auth")
+
+
+def _when_leader(callback):
+    # Polls for an exclusive lock next to users.db from a daemon thread; whichever
+    # worker process holds it runs the periodic jobs, and a waiting worker takes over
+    # when it exits. Non-blocking so the wait also works under gevent workers.
+    try:
+        import fcntl
+    except ImportError:  # Windows: single process
+        callback()
+        return
+
+    def wait():
+        global _leader_lock
+        handle = open(f"{db.DB_NAME}.leader", "a")
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                time.sleep(LEADER_RETRY_SECONDS)
+        _leader_lock = handle
+        callback()
+
+    threading.Thread(target=wait, name="leader-lock", daemon=True).start()
+
+
+def start_background_workers():
+    # Outbox claims are leased, so every process can deliver
+    if os.getenv("SLACK_OUTBOX_WORKER", "1") == "1":
+        outbox.start_worker()
+    # Every process serves prompt syncs for its own requests; full cycles run in one
+    if os.getenv("HOUR_SYNC_WORKER", "1") == "1":
+        hour_sync.start_worker(SITE_CONFIG.get("start_date", ""), periodic=False)
+        _when_leader(hour_sync.enable_periodic)
+
+
+def stop_background_workers():
+    outbox.stop_worker()
+    hour_sync.stop_worker()
+    images.shutdown()
+
+
+def warmup():
+    # Fills the caches the first requests would otherwise pay for
+    catalog.snapshot()
+    db.get_change_log_bounds()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+
+def create_app():
+    global _app_ready
+    with _app_lock:
+        if not _app_ready:
+            configure()
+            start_background_workers()
+            warmup()
+            _app_ready = True
+    return app
+
+
+def resolve_roles(email, slack_id):
+    is_admin = email in ADMIN_IDS or slack_id in ADMIN_IDS
+    is_reviewer = is_admin or slack_id in REVIEWER_IDS
+    return is_admin, is_reviewer
 
-# Load DBs
-db.init_db()
-admin_db.init_db()
 
 def get_current_user(clear_stale=True):
-    user_id = session.get("user_id")
-    if not user_id:
-        return None
-    user = db.get_user_by_id(user_id)
-    if not user and clear_stale:
-        session.pop("user_id", None)
-        session.pop("email", None)
-        session.pop("slack_id", None)
-        session.pop("nickname", None)
-        return None
-    is_admin = bool(
-        (user.get("email") in SITE_CONFIG['admin_slacks']) or (user.get("slack_id") in SITE_CONFIG['admin_slacks'])
-    )
-    is_reviewer = bool((user.get("slack_id") in SITE_CONFIG['reviewer_slacks']) or is_admin)
-    user_with_roles = dict(user)
-    user_with_roles["is_admin"] = is_admin
-    user_with_roles["is_reviewer"] = is_reviewer
-    return user_with_roles
+    if "current_user" in g:
+        return g.current_user
+    g.current_user = _load_current_user(clear_stale)
+    return g.current_user
+
+
+def session_payload(user):
+    is_admin, is_reviewer = resolve_roles(user.get("email"), user.get("slack_id"))
+    roles = (sessions.ROLE_ADMIN if is_admin else 0) | (sessions.ROLE_REVIEWER if is_reviewer else 0)
+    return sessions.issue(user, roles, ROLE_KEY)
+
+
+def start_session(user):
+    # Stores a signed snapshot of a users row, so later requests authenticate without
+    # touching the database until the row's session_epoch moves
+    payload = session_payload(user)
+    for key in LEGACY_SESSION_KEYS:
+        session.pop(key, None)
+    session[SESSION_KEY] = payload
+    return payload
+
+
+def _load_current_user(clear_stale):
+    payload = session.get(SESSION_KEY)
+    user = sessions.restore(payload)
+    if user is not None and payload.get("rk") != ROLE_KEY:
+        # The role lists changed since this session was issued; the snapshot is still good
+        payload = start_session(dict(user, session_epoch=payload["ep"]))
+    if user is None:
+        user_id = payload.get("uid") if isinstance(payload, dict) else session.get("user_id")
+        if not user_id:
+            return None
+        user = db.get_user_by_id(user_id)
+        if not user:
+            if clear_stale:
+                session.pop(SESSION_KEY, None)
+                for key in LEGACY_SESSION_KEYS:
+                    session.pop(key, None)
+            return None
+        payload = start_session(user)
+        user = sessions.snapshot(payload)
+    user["is_admin"] = bool(payload["r"] & sessions.ROLE_ADMIN)
+    user["is_reviewer"] = bool(payload["r"] & sessions.ROLE_REVIEWER)
+    return user
+
+
+@app.before_request
+def start_request_metrics():
+    if METRICS_ENABLED:
+        metrics.start_request()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    if METRICS_ENABLED:
+        req = metrics.finish_request(request.endpoint or "unmatched", response.status_code)
+        if req is not None:
+            response.headers["Server-Timing"] = metrics.server_timing(req)
+    return response
+
+
+@app.after_request
+def cache_uploads(response):
+    # Uploads are named by content hash, so a URL never changes what it points at
+    if request.endpoint == "static" and response.status_code == 200:
+        path = request.view_args.get("filename", "")
+        if path.startswith("uploads/") and images.is_content_addressed(path[len("uploads/"):]):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
 
 
 @app.context_processor
@@ -136,6 +327,22 @@ def login():
     return redirect(auth_url)
 
 
+def id_token_claims(id_token):
+    # Claims from a verified ID token, or None when login has to ask userinfo instead
+    if not id_token:
+        return None
+    try:
+        claims = oidc.verify_id_token(id_token, JWKS_URL, CLIENT_ID, OIDC_ISSUER)
+    except (oidc.InvalidToken, requests.RequestException, ValueError) as e:
+        print(f"ID token not usable, falling back to userinfo: {e}")
+        return None
+    if any(claims.get(k) is None for k in ID_TOKEN_CLAIMS):
+        return None
+    if not (claims.get("nickname") or claims.get("name")):
+        return None
+    return claims
+
+
 # GET /auth/callback
 @app.route("/auth/callback")
 def auth_callback():
@@ -154,18 +361,28 @@ def auth_callback():
         "code": code,
         "grant_type": "authorization_code",
     }
-    token_response = requests.post(TOKEN_URL, data=token_data)
+    try:
+        token_response = http_client.post(TOKEN_URL, data=token_data)
+    except requests.RequestException as e:
+        print(f"Token exchange failed: {e}")
+        return "Error: Failed to get tokens", 502
     if token_response.status_code != 200:
         return "Error: Failed to get tokens", 400
     tokens = token_response.json()
     access_token = tokens.get("access_token")
     if not access_token:
         return "Error: No access token", 400
-    headers = {"Authorization": f"Bearer {access_token}"}
-    userinfo_response = requests.get(USERINFO_URL, headers=headers)
-    if userinfo_response.status_code != 200:
-        return "Error: Failed to get user info", 400
-    userinfo = userinfo_response.json()
+    userinfo = id_token_claims(tokens.get("id_token"))
+    if userinfo is None:
+        headers = {"Authorization": f"Bearer {access_token}"}
+        try:
+            userinfo_response = http_client.get(USERINFO_URL, headers=headers)
+        except requests.RequestException as e:
+            print(f"Userinfo request failed: {e}")
+            return "Error: Failed to get user info", 502
+        if userinfo_response.status_code != 200:
+            return "Error: Failed to get user info", 400
+        userinfo = userinfo_response.json()
     if userinfo.get("verification_status") != "verified" or not userinfo.get(
         "ysws_eligible"
     ):
@@ -175,19 +392,15 @@ def auth_callback():
     slack_id = userinfo.get("slack_id")
     
     if not SITE_CONFIG.get("active"):
-        is_admin = (email in SITE_CONFIG.get("admin_slacks", [])) or (
-            slack_id in SITE_CONFIG.get("admin_slacks", [])
-        )
-        is_reviewer = (slack_id in SITE_CONFIG.get("reviewer_slacks", [])) or is_admin
+        is_admin, is_reviewer = resolve_roles(email, slack_id)
         if not (is_admin or is_reviewer):
             session.clear()
             return redirect(url_for("index"))
         
     user_id = db.get_or_create_user(email, nickname, slack_id)
-    session["user_id"] = user_id
-    session["slack_id"] = slack_id
-    session["email"] = email
-    session["nickname"] = nickname
+    user = db.get_user_by_id(user_id)
+    session.clear()
+    start_session(user)
     return redirect(url_for("dashboard"))
 
 
@@ -286,6 +499,106 @@ def reviewer():
     return render_template("reviewer.html")
 
 
+PUBLIC_CACHE_CONTROL = "public, max-age=15, stale-while-revalidate=300"
+RESPONSE_CACHE_SIZE = 256
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def cached_json_response(key, version, build):
+    # Serves a pre-serialized body for `key` until `version` moves; answers If-None-Match with 304.
+    etag = hashlib.sha1(f"{key}\0{version}".encode()).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        with _response_cache_lock:
+            entry = _response_cache.get(key)
+            if entry:
+                _response_cache.move_to_end(key)
+        if entry and entry[0] == etag:
+            body = entry[1]
+        else:
+            body = app.json.dumps(build(), separators=(",", ":"))
+            with _response_cache_lock:
+                _response_cache[key] = (etag, body)
+                _response_cache.move_to_end(key)
+                while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                    _response_cache.popitem(last=False)
+        response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = PUBLIC_CACHE_CONTROL
+    return response
+
+
+PUBLIC_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 500
+PUBLIC_PROJECT_FIELDS = {
+    "id", "user_id", "title", "description", "demo_link", "github_link",
+    "hackatime_project", "hours", "paid_hours", "status", "image_url",
+    "created_at", "updated_at", "slack_id", "digital_hours",
+}
+STATUS_FILTERS = {
+    "building": "Building",
+    "shipped": "Shipped",
+    "pending": "Pending Review",
+    "pendingreview": "Pending Review",
+}
+
+
+def normalize_status(value):
+    key = "".join(ch for ch in value.lower() if ch.isalnum())
+    return STATUS_FILTERS.get(key)
+
+
+def digital_hours(hours):
+    total_seconds = int((hours or 0) * 3600)
+    h = int(total_seconds // 3600)
+    m = int((total_seconds % 3600) // 60)
+    sec = int(total_seconds % 60)
+    return f"{h:02d}:{m:02d}:{sec:02d}"
+
+
+def encode_cursor(row):
+    raw = json.dumps([row["created_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(value):
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        created_at, row_id = json.loads(raw)
+        return str(created_at), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def parse_page_args(default_limit=None):
+    limit = request.args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("Invalid limit")
+        if limit < 1:
+            raise ValueError("Invalid limit")
+        limit = min(limit, MAX_PAGE_LIMIT)
+    else:
+        limit = default_limit
+    cursor = request.args.get("cursor")
+    fields = request.args.get("fields")
+    return {
+        "limit": limit,
+        "cursor": decode_cursor(cursor) if cursor else None,
+        "fields": [f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+    }
+
+
+def page_cursor(rows, limit):
+    if limit and len(rows) == limit:
+        return encode_cursor(rows[-1])
+    return None
+
+
 # GET /api/projects
 @app.route("/api/projects", methods=["GET"])
 def get_projects():
@@ -294,82 +607,58 @@ def get_projects():
         if not user:
             return jsonify({"error": "Unauthorized"}), 401
 
-        slack_id = user.get("slack_id")
-        hackatime_response = requests.get(
-            f"https://hackatime.hackclub.com/api/v1/users/{slack_id}/stats?limit=1000&features=projects&start_date={SITE_CONFIG['start_date']}"
-        ).json()
+        # Hours for Building projects are kept up to date by hour_sync; this read only nudges it.
+        hour_sync.request_sync(user["id"])
+        change_id = db.get_change_log_bounds()[1]
         projects = db.get_user_projects(user["id"])
-        hackatime_projects = hackatime_response.get("data", {}).get("projects", [])
         projects_with_hours = []
 
         for proj in projects:
-            project_id = proj["id"]
-            status = proj.get("status")
-            if status in ["Shipped", "Pending Review"]:
-                total_hours = proj["hours"] if proj["hours"] else 0
-                total_seconds = total_hours * 3600
-            else:
-                hackatime_project_names = (
-                    proj["hackatime_project"] if proj["hackatime_project"] else ""
-                )
-                total_seconds = 0
-                if hackatime_project_names:
-                    project_names = [
-                        name.strip() for name in hackatime_project_names.split(",")
-                    ]
-                    for project_name in project_names:
-                        for hp in hackatime_projects:
-                            if hp.get("name") == project_name:
-                                total_seconds += hp.get("total_seconds", 0)
-                                break
-                total_hours = total_seconds / 3600.0
-                stored_hours = proj["hours"] if proj["hours"] else 0
-                if abs(stored_hours - total_hours) > 0.01:
-                    db.update_project_hours(project_id, total_hours)
-                    proj["hours"] = total_hours
-
-            hours = int(total_seconds // 3600)
-            minutes = int((total_seconds % 3600) // 60)
-            seconds = int(total_seconds % 60)
-            digital_format = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
             project_with_hours = dict(proj)
-            project_with_hours["digital_hours"] = digital_format
+            project_with_hours["digital_hours"] = digital_hours(proj.get("hours"))
             projects_with_hours.append(project_with_hours)
 
-        return jsonify({"projects": projects_with_hours})
+        return jsonify({"projects": projects_with_hours, "change_id": change_id})
 
     status_q = request.args.get("status")
     author_q = request.args.get("author")
 
     if status_q:
-        key = "".join(ch for ch in status_q.lower() if ch.isalnum())
-        status_map = {
-            "building": "Building",
-            "shipped": "Shipped",
-            "pending": "Pending Review",
-            "pendingreview": "Pending Review",
-        }
-        if key not in status_map:
+        status_q = normalize_status(status_q)
+        if not status_q:
             return jsonify({"error": "Invalid status filter"}), 400
-        status_q = status_map[key]
 
-    projects = db.get_all_projects(status_q) if status_q else db.get_all_projects()
-
-    if author_q:
-        projects = [p for p in projects if p.get("slack_id") == author_q]
+    try:
+        page = parse_page_args(PUBLIC_PAGE_LIMIT)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    fields = page["fields"]
+    if fields is not None:
+        fields = [f for f in fields if f in PUBLIC_PROJECT_FIELDS]
+        if "digital_hours" in fields and "hours" not in fields:
+            fields.append("hours")
+    else:
+        fields = sorted(PUBLIC_PROJECT_FIELDS - {"digital_hours"})
+
+    def build():
+        projects = db.list_projects(
+            status=status_q,
+            author_slack_id=author_q,
+            limit=page["limit"],
+            cursor=page["cursor"],
+            fields=fields,
+        )
+        wanted = set(page["fields"] or PUBLIC_PROJECT_FIELDS)
+        public_projects = []
+        for proj in projects:
+            proj_public = {k: v for k, v in proj.items() if k in wanted}
+            if "digital_hours" in wanted:
+                proj_public["digital_hours"] = digital_hours(proj.get("hours"))
+            public_projects.append(proj_public)
+        return {"projects": public_projects, "next_cursor": page_cursor(projects, page["limit"])}
 
-    public_projects = []
-    for proj in projects:
-        proj_public = dict(proj)
-        proj_public.pop("nickname", None)
-        proj_public.pop("email", None)
-        total_seconds = int((proj_public.get("hours") or 0) * 3600)
-        hours = int(total_seconds // 3600)
-        minutes = int((total_seconds % 3600) // 60)
-        seconds = int(total_seconds % 60)
-        proj_public["digital_hours"] = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        public_projects.append(proj_public)
-    return jsonify({"projects": public_projects})
+    version = db.get_change_version(f"projects:{status_q}" if status_q else "projects")
+    return cached_json_response(request.full_path, version, build)
 
 
 # GET /api/hackatime
@@ -381,9 +670,14 @@ def get_hackatime():
 
     slack_id = user.get("slack_id")
 
-    hackatime_response = requests.get(
-        f"https://hackatime.hackclub.com/api/v1/users/{slack_id}/stats?limit=1000&features=projects&start_date={SITE_CONFIG['start_date']}"
-    ).json()
+    try:
+        hackatime_response = hackatime.get_stats(slack_id, SITE_CONFIG['start_date'])
+    except hackatime.UnknownUser:
+        return jsonify({"data": {"projects": []}})
+    except requests.RequestException as e:
+        # Includes http_client.HostBusy
+        print(f"Hackatime request failed: {e}")
+        return jsonify({"error": "Hackatime is unavailable"}), 502
     return jsonify(hackatime_response)
 
 
@@ -395,27 +689,23 @@ def create_project():
         return jsonify({"error": "Unauthorized"}), 401
 
     data = request.get_json()
-    hackatime_str = (data.get("hackatime_project") or "").strip()
-    desired_names = [n.strip() for n in hackatime_str.split(",") if n.strip()]
-    conflicts = db.check_hackatime_projects_available(user["id"], desired_names)
-
-    if conflicts:
+    try:
+        project_id = db.create_project(
+            user_id=user["id"],
+            title=data.get("title"),
+            description=data.get("description"),
+            demo_link=data.get("demo_link"),
+            github_link=data.get("github_link"),
+            hackatime_project=data.get("hackatime_project"),
+            image_url=data.get("image_url"),
+        )
+    except db.HackatimeProjectConflict as e:
         return (
             jsonify(
-                {"error": "Hackatime project(s) already linked", "conflicts": conflicts}
+                {"error": "Hackatime project(s) already linked", "conflicts": e.conflicts}
             ),
             400,
         )
-
-    project_id = db.create_project(
-        user_id=user["id"],
-        title=data.get("title"),
-        description=data.get("description"),
-        demo_link=data.get("demo_link"),
-        github_link=data.get("github_link"),
-        hackatime_project=data.get("hackatime_project"),
-        image_url=data.get("image_url"),
-    )
     return jsonify({"success": True, "project_id": project_id}), 201
 
 
@@ -434,16 +724,24 @@ def upload_file():
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
     
-    if file and allowed_file(file.filename):
-        ext = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"{uuid.uuid4().hex}.{ext}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        file_url = url_for('static', filename=f'uploads/{filename}', _external=True)
-        return jsonify({"success": True, "url": file_url}), 200
-    
-    return jsonify({"error": "Invalid file type"}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"error": "Invalid file type"}), 400
+
+    try:
+        variants = images.process_upload(file.read(), app.config['UPLOAD_FOLDER'])
+    except images.InvalidImage as e:
+        return jsonify({"error": str(e)}), 400
+    except images.ImagesBusy as e:
+        return jsonify({"error": f"{e}; please try again"}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        print(f"Image processing failed: {e}")
+        return jsonify({"error": "Could not process image"}), 500
+
+    urls = {
+        variant: url_for('static', filename=f'uploads/{filename}', _external=True)
+        for variant, filename in variants.items()
+    }
+    return jsonify({"success": True, "url": urls["full"], "variants": urls}), 200
 
 
 # GET /api/projects/<int:project_id>
@@ -510,51 +808,38 @@ def update_project(project_id):
                 if curr:
                     ht_names = curr.get("hackatime_project", "")
             if ht_names and slack_id:
-                hackatime_response = requests.get(
-                    f"https://hackatime.hackclub.com/api/v1/users/{slack_id}/stats?limit=1000&features=projects&start_date={SITE_CONFIG['start_date']}"
-                ).json()
-                hackatime_projects = hackatime_response.get("data", {}).get(
-                    "projects", []
+                hackatime_seconds = hackatime.seconds_by_name(
+                    hackatime.get_projects(slack_id, SITE_CONFIG['start_date'], fresh=True)
+                )
+                total_seconds = hackatime.total_seconds(
+                    hackatime_seconds, db.split_hackatime_names(ht_names)
                 )
-                project_names = [n.strip() for n in ht_names.split(",")]
-                total_seconds = 0
-                for project_name in project_names:
-                    for hp in hackatime_projects:
-                        if hp.get("name") == project_name:
-                            total_seconds += hp.get("total_seconds", 0)
-                            break
                 hours_to_update = total_seconds / 3600.0
         except Exception as e:
             print(f"Error syncing hours on submit: {e}")
 
-    if "hackatime_project" in data and not user["is_reviewer"]:
-        ht_str = (data.get("hackatime_project") or "").strip()
-        desired_names = [n.strip() for n in ht_str.split(",") if n.strip()]
-        conflicts = db.check_hackatime_projects_available(
-            project["user_id"], desired_names, exclude_project_id=project_id
+    try:
+        success = db.update_project(
+            project_id=project_id,
+            title=data.get("title"),
+            description=data.get("description"),
+            demo_link=data.get("demo_link"),
+            github_link=data.get("github_link"),
+            hackatime_project=data.get("hackatime_project"),
+            hours=hours_to_update,
+            status=data.get("status"),
+            image_url=data.get("image_url"),
+        )
+    except db.HackatimeProjectConflict as e:
+        return (
+            jsonify(
+                {
+                    "error": "Hackatime project(s) already linked",
+                    "conflicts": e.conflicts,
+                }
+            ),
+            400,
         )
-        if conflicts:
-            return (
-                jsonify(
-                    {
-                        "error": "Hackatime project(s) already linked",
-                        "conflicts": conflicts,
-                    }
-                ),
-                400,
-            )
-
-    success = db.update_project(
-        project_id=project_id,
-        title=data.get("title"),
-        description=data.get("description"),
-        demo_link=data.get("demo_link"),
-        github_link=data.get("github_link"),
-        hackatime_project=data.get("hackatime_project"),
-        hours=hours_to_update,
-        status=data.get("status"),
-        image_url=data.get("image_url"),
-    )
     return jsonify({"success": success})
 
 
@@ -610,19 +895,84 @@ def get_user_profile():
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
 
-    project_count = db.count_projects(user["id"])
-    total_hours = db.get_total_hours(user["id"])
+    stats = db.get_profile_stats(user["id"])
 
     return jsonify(
-        {"user": user, "project_count": project_count, "total_hours": total_hours}
+        {"user": user, "project_count": stats["project_count"], "total_hours": stats["total_hours"]}
     )
 
 
+# GET /api/user/ledger (balance history, newest first)
+@app.route("/api/user/ledger", methods=["GET"])
+def get_user_ledger():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        limit = min(int(request.args.get("limit", 100)), MAX_PAGE_LIMIT)
+        before_id = int(request.args["before_id"]) if request.args.get("before_id") else None
+    except ValueError:
+        return jsonify({"error": "Invalid pagination"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid pagination"}), 400
+
+    entries = db.get_hours_ledger(user["id"], limit, before_id)
+    next_before = entries[-1]["id"] if len(entries) == limit else None
+    return jsonify({"balance": user.get("hours", 0), "entries": entries, "next_before_id": next_before})
+
+
+# GET /api/admin/stats
+@app.route("/api/admin/stats", methods=["GET"])
+def admin_stats():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    if not user["is_admin"]:
+        return jsonify({"error": "Unauthorized"}), 403
+    return jsonify(db.get_project_stats())
+
+
+# GET /metrics (Prometheus text format; bearer METRICS_TOKEN or an admin session)
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Not found"}), 404
+    authorized = bool(METRICS_TOKEN) and request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}"
+    if not authorized:
+        user = get_current_user()
+        if not user or not user["is_admin"]:
+            return jsonify({"error": "Unauthorized"}), 401
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# GET/POST /api/admin/profiling (admin: sampled cProfile of live requests)
+@app.route("/api/admin/profiling", methods=["GET", "POST"])
+def admin_profiling():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    if not user["is_admin"]:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    if request.method == "POST":
+        data = request.get_json() or {}
+        try:
+            rate = float(data.get("rate", 0.01 if data.get("enabled") else 0))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid rate"}), 400
+        metrics.set_profiling(rate if data.get("enabled", True) else 0)
+
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "calls"):
+        return jsonify({"error": "Invalid sort"}), 400
+    return jsonify(metrics.profile_report(sort=sort))
+
+
 # GET /api/faqs
 @app.route("/api/faqs", methods=["GET"])
 def get_faqs():
-    faqs = admin_db.get_all_faqs()
-    return jsonify({"faqs": faqs})
+    snap = catalog.snapshot()
+    return cached_json_response("faqs", snap.faqs_version, lambda: {"faqs": [dict(f) for f in snap.faqs]})
 
 
 # POST /api/admin/faqs
@@ -643,6 +993,7 @@ def create_faq_endpoint():
         return jsonify({"error": "Question and answer required"}), 400
 
     faq_id = admin_db.create_faq(question, answer)
+    catalog.invalidate()
     return jsonify({"success": True, "faq_id": faq_id}), 201
 
 
@@ -657,14 +1008,31 @@ def delete_faq_endpoint(faq_id):
         return jsonify({"error": "Unauthorized"}), 403
 
     success = admin_db.delete_faq(faq_id)
+    catalog.invalidate()
     return jsonify({"success": success})
 
 
 # GET /api/rewards
 @app.route("/api/rewards", methods=["GET"])
 def get_rewards():
-    rewards = admin_db.get_all_rewards()
-    return jsonify({"rewards": rewards})
+    snap = catalog.snapshot()
+    stock_version = db.get_change_version("reward_stock")
+
+    def build():
+        stock = db.get_reward_stock()
+        return {"rewards": [dict(r, stock=stock.get(r["id"])) for r in snap.rewards]}
+
+    return cached_json_response("rewards", f"{snap.rewards_version}:{stock_version}", build)
+
+
+def parse_stock(value):
+    # None/"" means unlimited; otherwise a non-negative integer
+    if value is None or value == "":
+        return None
+    stock = int(value)
+    if stock < 0:
+        raise ValueError("negative stock")
+    return stock
 
 
 # POST /api/admin/rewards
@@ -689,11 +1057,40 @@ def create_reward_endpoint():
         cost = float(cost)
     except (ValueError, TypeError):
         return jsonify({"error": "Cost must be a number"}), 400
+    try:
+        stock = parse_stock(data.get("stock"))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Stock must be a non-negative whole number"}), 400
 
     reward_id = admin_db.create_reward(name, description, cost, image_url)
+    if stock is not None:
+        db.set_reward_stock(reward_id, stock)
+    catalog.invalidate()
     return jsonify({"success": True, "reward_id": reward_id}), 201
 
 
+# PUT /api/admin/rewards/<int:reward_id>/stock (admin: set remaining stock, null = unlimited)
+@app.route("/api/admin/rewards/<int:reward_id>/stock", methods=["PUT"])
+def set_reward_stock_endpoint(reward_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if not user["is_admin"]:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    if not catalog.get_reward(reward_id):
+        return jsonify({"error": "Reward not found"}), 404
+    data = request.get_json() or {}
+    try:
+        stock = parse_stock(data.get("stock"))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Stock must be a non-negative whole number"}), 400
+
+    db.set_reward_stock(reward_id, stock)
+    return jsonify({"success": True, "stock": stock})
+
+
 # DELETE /api/admin/rewards/<int:reward_id>
 @app.route("/api/admin/rewards/<int:reward_id>", methods=["DELETE"])
 def delete_reward_endpoint(reward_id):
@@ -705,6 +1102,9 @@ def delete_reward_endpoint(reward_id):
         return jsonify({"error": "Unauthorized"}), 403
 
     success = admin_db.delete_reward(reward_id)
+    if success:
+        db.set_reward_stock(reward_id, None)
+    catalog.invalidate()
     return jsonify({"success": success})
 
 
@@ -718,8 +1118,117 @@ def get_reviewer_projects():
     if not user["is_reviewer"]:
         return jsonify({"error": "Unauthorized"}), 403
 
-    projects = db.get_all_projects()
-    return jsonify({"projects": projects})
+    status_q = request.args.get("status")
+    if status_q:
+        status_q = normalize_status(status_q)
+        if not status_q:
+            return jsonify({"error": "Invalid status filter"}), 400
+    try:
+        page = parse_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Read before the list so a stream started from it can't miss a change made in between
+    change_id = db.get_change_log_bounds()[1]
+    projects = db.list_projects(
+        status=status_q,
+        author_slack_id=request.args.get("author"),
+        limit=page["limit"],
+        cursor=page["cursor"],
+        fields=page["fields"],
+    )
+    return jsonify({
+        "projects": projects,
+        "next_cursor": page_cursor(projects, page["limit"]),
+        "change_id": change_id,
+    })
+
+
+CHANGE_BATCH_SIZE = 500
+PROJECT_EVENT_FIELDS = set(db.PROJECT_LIST_COLUMNS)
+
+
+def change_events(changes, scope):
+    # Collapses each entity to its newest change in the batch and renders it with
+    # the entity's current row (one IN query per entity type).
+    latest = {}
+    for change in changes:
+        mine = change["user_id"] == scope["user_id"]
+        if change["entity"] == "project" and not (mine or scope["all_projects"]):
+            continue
+        if change["entity"] == "order" and not (mine or scope["all_orders"]):
+            continue
+        latest.pop((change["entity"], change["entity_id"]), None)
+        latest[(change["entity"], change["entity_id"])] = change
+    if not latest:
+        return
+    projects = db.get_projects_by_ids([eid for entity, eid in latest if entity == "project"])
+    orders = db.get_orders_by_ids([eid for entity, eid in latest if entity == "order"])
+    for (entity, entity_id), change in latest.items():
+        if entity == "project":
+            row = projects.get(entity_id)
+            if row is None or change["action"] == "deleted":
+                data = {"action": "deleted", "id": entity_id}
+            else:
+                project = {k: v for k, v in row.items() if k in PROJECT_EVENT_FIELDS}
+                project["digital_hours"] = digital_hours(project.get("hours"))
+                data = {"action": change["action"], "project": project}
+        else:
+            data = {"action": change["action"], "order": orders.get(entity_id) or {"id": entity_id}}
+        yield events.format_event(entity, data, change["id"])
+
+
+def stream_changes(since, oldest, newest, scope):
+    yield f"retry: {events.RETRY_MS}\n\n"
+    if since < oldest - 1:
+        # The client's position was pruned away; it has to reload and resume from here
+        yield events.format_event("reset", {}, newest)
+        since = newest
+    deadline = time.monotonic() + events.MAX_STREAM_SECONDS
+    while time.monotonic() < deadline:
+        wait = min(events.HEARTBEAT_INTERVAL, deadline - time.monotonic())
+        if events.wait_for_changes(since, wait) <= since:
+            yield ": ping\n\n"
+            continue
+        while True:
+            changes = db.get_changes(since, CHANGE_BATCH_SIZE)
+            if not changes:
+                break
+            yield from change_events(changes, scope)
+            since = changes[-1]["id"]
+            if len(changes) < CHANGE_BATCH_SIZE:
+                break
+
+
+# GET /api/events (Server-Sent Events: project and order changes visible to the user)
+@app.route("/api/events", methods=["GET"])
+def event_stream():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return jsonify({"error": "Invalid event id"}), 400
+    oldest, newest = db.get_change_log_bounds()
+    if since is None or since > newest:
+        since = newest
+
+    # Streams hold a thread each unless the worker is cooperative (see events.THREAD_STREAMS)
+    limited = not cooperative.active()
+    if limited and not events.acquire_stream():
+        return jsonify({"error": "Live updates unavailable"}), 503, {"Retry-After": "30"}
+    scope = {"user_id": user["id"], "all_projects": user["is_reviewer"], "all_orders": user["is_admin"]}
+    response = app.response_class(
+        stream_changes(since, oldest, newest, scope),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    if limited:
+        response.call_on_close(events.release_stream)
+    return response
 
 
 # POST /api/reviewer/projects/<int:project_id>/approve
@@ -741,9 +1250,11 @@ def approve_project(project_id):
         project["slack_id"] = project_user["slack_id"]
         project["nickname"] = project_user["nickname"]
 
-    success = db.update_project_status(project_id, "Shipped")
+    success = db.update_project_status(
+        project_id, "Shipped", notifications=slack.project_shipped_messages(project)
+    )
     if success:
-        slack.project_shipped(project)
+        outbox.notify()
 
     return jsonify({"success": success})
 
@@ -770,9 +1281,11 @@ def reject_project(project_id):
     data = request.get_json()
     reason = data.get("reason", "") if data else ""
 
-    success = db.update_project_status(project_id, "Building")
+    success = db.update_project_status(
+        project_id, "Building", notifications=slack.project_rejected_messages(project, reason)
+    )
     if success:
-        slack.project_rejected(project, reason)
+        outbox.notify()
 
     return jsonify({"success": success})
 
@@ -803,6 +1316,94 @@ def pay_project(project_id):
     if success:
         return jsonify({"success": True, "paid": amount})
     return jsonify({"success": False}), 500
+
+
+BULK_ACTION_LIMIT = 500
+
+
+def parse_project_ids(values):
+    # De-duplicated list of int ids, or ValueError
+    if not isinstance(values, list) or not values:
+        raise ValueError("project_ids must be a non-empty list")
+    if len(values) > BULK_ACTION_LIMIT:
+        raise ValueError(f"At most {BULK_ACTION_LIMIT} projects per request")
+    ids = []
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValueError("Invalid project id")
+        project_id = int(value)
+        if project_id not in ids:
+            ids.append(project_id)
+    return ids
+
+
+def bulk_review(status, build_messages):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    if not user["is_reviewer"]:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    data = request.get_json() or {}
+    try:
+        project_ids = parse_project_ids(data.get("project_ids"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    projects = db.get_projects_by_ids(project_ids)
+    notifications = {pid: build_messages(project, data) for pid, project in projects.items()}
+    updated = db.set_project_statuses(
+        list(projects), status, notifications=notifications, from_status="Pending Review"
+    )
+    if updated:
+        outbox.notify()
+    skipped = [pid for pid in project_ids if pid not in set(updated)]
+    return jsonify({"success": True, "updated": updated, "skipped": skipped})
+
+
+# POST /api/reviewer/projects/bulk/approve {"project_ids": [...]}
+@app.route("/api/reviewer/projects/bulk/approve", methods=["POST"])
+def bulk_approve_projects():
+    return bulk_review("Shipped", lambda project, data: slack.project_shipped_messages(project))
+
+
+# POST /api/reviewer/projects/bulk/reject {"project_ids": [...], "reason": "..."}
+@app.route("/api/reviewer/projects/bulk/reject", methods=["POST"])
+def bulk_reject_projects():
+    return bulk_review(
+        "Building",
+        lambda project, data: slack.project_rejected_messages(project, data.get("reason", "")),
+    )
+
+
+# POST /api/reviewer/projects/bulk/pay {"payments": [{"project_id": 1, "amount": 2.5}, ...]}
+@app.route("/api/reviewer/projects/bulk/pay", methods=["POST"])
+def bulk_pay_projects():
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    if not user["is_admin"]:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    data = request.get_json() or {}
+    payments = data.get("payments")
+    if not isinstance(payments, list) or not payments:
+        return jsonify({"error": "payments must be a non-empty list"}), 400
+    if not all(isinstance(p, dict) for p in payments):
+        return jsonify({"error": "Invalid payment"}), 400
+    try:
+        project_ids = parse_project_ids([p.get("project_id") for p in payments])
+        amounts = [float(p.get("amount", 0)) for p in payments]
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid payment"}), 400
+    if len(project_ids) != len(payments):
+        return jsonify({"error": "Each project can only be paid once per request"}), 400
+    if any(amount < 0 for amount in amounts):
+        return jsonify({"error": "Amount must be >= 0"}), 400
+
+    paid = db.set_project_paid_hours_bulk(list(zip(project_ids, amounts)))
+    skipped = [pid for pid in project_ids if pid not in set(paid)]
+    return jsonify({"success": True, "paid": paid, "skipped": skipped})
              
 # POST /api/orders
 @app.route("/api/orders", methods=["POST"])
@@ -822,7 +1423,7 @@ def create_order_endpoint():
     if not all([reward_id, quantity, name, email]):
         return jsonify({"error": "Missing required fields"}), 400
 
-    reward = admin_db.get_reward_by_id(int(reward_id))
+    reward = catalog.get_reward(int(reward_id))
     if not reward:
         return jsonify({"error": "Reward not found"}), 404
 
@@ -831,8 +1432,19 @@ def create_order_endpoint():
 
     total_cost = float(reward["cost"]) * quantity
 
-    order_id = db.create_order(user["id"], int(reward_id), quantity, name, email, phone, address, total_cost)
-    if order_id is None:
+    idempotency_key = request.headers.get("Idempotency-Key") or None
+    if idempotency_key and len(idempotency_key) > 255:
+        return jsonify({"error": "Invalid Idempotency-Key"}), 400
+
+    try:
+        order_id = db.create_order(
+            user["id"], int(reward_id), quantity, name, email, phone, address, total_cost, idempotency_key
+        )
+    except db.OrderRejected as e:
+        if e.reason == "out_of_stock":
+            return jsonify({"error": "Out of stock"}), 409
+        if e.reason == "idempotency_key_reused":
+            return jsonify({"error": "Idempotency-Key was already used for a different order"}), 422
         return jsonify({"error": "Insufficient hours balance"}), 400
 
     new_user = db.get_user_by_id(user["id"])
@@ -861,6 +1473,78 @@ def admin_list_orders():
     return jsonify({"orders": orders})
 
 
+EXPORT_KINDS = {"orders", "projects", "users"}
+ADDRESS_FIELDS = ("address", "suburb", "postcode", "state", "country")
+CSV_FLUSH_BYTES = 64 * 1024
+
+
+def export_records(kind, rows):
+    for row in rows:
+        if kind == "orders":
+            try:
+                address = json.loads(row.get("address") or "{}")
+            except Exception:
+                address = {}
+            row["address"] = address if isinstance(address, dict) else {}
+        yield row
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield app.json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def csv_chunks(records):
+    buf = io.StringIO()
+    writer = None
+    for record in records:
+        address = record.pop("address", None)
+        if isinstance(address, dict):
+            for field in ADDRESS_FIELDS:
+                record[f"address_{field}"] = address.get(field, "")
+        if writer is None:
+            writer = csv.DictWriter(buf, fieldnames=list(record.keys()), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(record)
+        if buf.tell() >= CSV_FLUSH_BYTES:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+# GET /api/admin/export/<kind> (admin: streaming NDJSON/CSV export)
+@app.route("/api/admin/export/<kind>", methods=["GET"])
+def admin_export(kind):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    if not user["is_admin"]:
+        return jsonify({"error": "Unauthorized"}), 403
+    if kind not in EXPORT_KINDS:
+        return jsonify({"error": "Unknown export"}), 404
+
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "Invalid format"}), 400
+    try:
+        since_id = int(request.args.get("since_id", 0))
+    except ValueError:
+        return jsonify({"error": "Invalid since_id"}), 400
+    since = request.args.get("since") or None
+
+    records = export_records(kind, db.iter_export_rows(kind, since_id=since_id, since=since))
+    if fmt == "csv":
+        body, mimetype = csv_chunks(records), "text/csv"
+    else:
+        body, mimetype = ndjson_lines(records), "application/x-ndjson"
+    return app.response_class(
+        body,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{fmt}"'},
+    )
+
+
 # PATCH /api/admin/orders/<id> (admin: set status/notes)
 @app.route("/api/admin/orders/<int:order_id>", methods=["PATCH"])
 def admin_update_order(order_id):
@@ -876,13 +1560,60 @@ def admin_update_order(order_id):
 
     ok = True
     if status:
-        if status not in ("pending", "fulfilled"):
+        if status not in ("pending", "fulfilled", "refunded"):
             return jsonify({"error": "Invalid status"}), 400
-        ok = ok and db.update_order_status(order_id, status)
+        if status == "refunded":
+            ok = ok and db.refund_order(order_id)
+        else:
+            ok = ok and db.update_order_status(order_id, status)
     if notes is not None:
         ok = ok and db.update_order_notes(order_id, notes)
 
     return jsonify({"success": ok})                                                                                                                                                                                                                                     
 
+@app.cli.command("check-stats")
+@click.option("--repair", is_flag=True, help="Rebuild the counters if they drifted.")
+def check_stats_command(repair):
+    drift = db.check_stats(repair=repair)
+    for line in drift:
+        click.echo(line)
+    if not drift:
+        click.echo("Stats counters are consistent.")
+    elif repair:
+        click.echo(f"Repaired {len(drift)} drifted counter(s).")
+    else:
+        raise SystemExit(1)
+
+
+@app.cli.command("reconcile-hours")
+@click.option("--repair", is_flag=True, help="Rewrite cached balances that differ from the ledger.")
+@click.option("--full", is_flag=True, help="Sum the whole ledger instead of starting from snapshots.")
+def reconcile_hours_command(repair, full):
+    drift = db.reconcile_balances(repair=repair, full=full)
+    for line in drift:
+        click.echo(line)
+    if not drift:
+        click.echo("Hour balances match the ledger.")
+    elif repair:
+        click.echo(f"Repaired {len(drift)} balance(s).")
+    else:
+        raise SystemExit(1)
+
+
+@app.cli.command("snapshot-hours")
+def snapshot_hours_command():
+    click.echo(f"Snapshotted {db.snapshot_hours_balances()} balance(s).")
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    for line in prepare():
+        click.echo(f"Applied migration {line}")
+    click.echo("Databases are up to date.")
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    prepare()
+    create_app()
+    # The reloader would run this module again in a child and start a second set of workers
+    app.run(debug=True, use_reloader=False)
@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from bench import dataset, stubs
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ENDPOINTS = [
+    "dashboard_projects",
+    "hackatime",
+    "showcase",
+    "rewards",
+    "faqs",
+    "reviewer_projects",
+    "order",
+    "approve",
+    "reject",
+    "auth_callback",
+]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else None,
+    }
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+
+    def setup(self):
+        args = self.args
+        self.workdir = Path(args.workdir or tempfile.mkdtemp(prefix="ysws-bench-"))
+        self.stubs = stubs.start_all(args.latency_ms / 1000)
+        os.environ.update({
+            "APP_SECRET": "bench-secret",
+            "CLIENT_ID": "bench",
+            "CLIENT_SECRET": "bench",
+            "HACKATIME_URL": self.stubs["hackatime"].url,
+            "SLACK_API_URL": self.stubs["slack"].url + "/api",
+            "AUTH_BASE_URL": self.stubs["auth"].url,
+            "OIDC_ISSUER": stubs.AUTH_ISSUER,
+            "SLACK_BOT_TOKEN": "xoxb-bench",
+            "HOUR_SYNC_WORKER": "1" if args.with_hour_sync else "0",
+        })
+        sys.path.insert(0, str(ROOT))
+
+        import db
+        import admin_db
+
+        db.DB_NAME = str(self.workdir / "users.db")
+        admin_db.ADMIN_DB_NAME = str(self.workdir / "admin.db")
+        started = time.perf_counter()
+        self.dataset = dataset.seed(args.users, args.projects_per_user, args.orders)
+        self.dataset["seed_seconds"] = round(time.perf_counter() - started, 2)
+
+        import app as app_module
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        app_module.create_app()
+        self.app_module = app_module
+        self.reviewer_id = 1
+        self.reviewer_slack = dataset.slack_id(self.reviewer_id)
+        app_module.ADMIN_IDS = frozenset({self.reviewer_slack})
+        app_module.REVIEWER_IDS = frozenset({self.reviewer_slack})
+
+        self.server = make_server(
+            "127.0.0.1", 0, app_module.app, threaded=True, request_handler=QuietHandler
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+        serializer = app_module.app.session_interface.get_signing_serializer(app_module.app)
+        self.cookie_name = app_module.app.config["SESSION_COOKIE_NAME"]
+        self.sign_session = lambda user_id: serializer.dumps(
+            {app_module.SESSION_KEY: app_module.session_payload(db.get_user_by_id(user_id))}
+        )
+
+        with db.get_db_connection() as conn:
+            self.pending_ids = [
+                row[0] for row in conn.execute("SELECT id FROM projects WHERE status = 'Pending Review'")
+            ]
+
+    def teardown(self):
+        self.server.shutdown()
+        for stub in self.stubs.values():
+            stub.stop()
+
+    def client(self, user_id):
+        session = requests.Session()
+        # Same domain the server's Set-Cookie gets, so a reissued session replaces this one
+        session.cookies.set(self.cookie_name, self.sign_session(user_id), domain="127.0.0.1")
+        return session
+
+    def random_user(self):
+        return self.rng.randint(2, self.dataset["users"])
+
+    def request_for(self, endpoint):
+        # Returns (user_id, method, path, kwargs)
+        if endpoint == "dashboard_projects":
+            return self.random_user(), "GET", "/api/projects?me=true", {}
+        if endpoint == "hackatime":
+            return self.random_user(), "GET", "/api/hackatime", {}
+        if endpoint == "showcase":
+            return None, "GET", "/api/projects?status=shipped&limit=30&fields=id,title,description,github_link,demo_link", {}
+        if endpoint == "rewards":
+            return None, "GET", "/api/rewards", {}
+        if endpoint == "faqs":
+            return None, "GET", "/api/faqs", {}
+        if endpoint == "reviewer_projects":
+            return self.reviewer_id, "GET", "/api/reviewer/projects", {}
+        if endpoint == "order":
+            body = {"reward_id": self.rng.randint(1, 30), "quantity": 1, "name": "Bench", "email": "b@example.com"}
+            return self.random_user(), "POST", "/api/orders", {"json": body}
+        if endpoint in ("approve", "reject"):
+            project_id = self.rng.choice(self.pending_ids)
+            kwargs = {"json": {"reason": "bench"}} if endpoint == "reject" else {}
+            return self.reviewer_id, "POST", f"/api/reviewer/projects/{project_id}/{endpoint}", kwargs
+        if endpoint == "auth_callback":
+            return None, "GET", "/auth/callback?code=bench", {"allow_redirects": False}
+        raise ValueError(endpoint)
+
+    def run_endpoint(self, endpoint):
+        args = self.args
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        remaining = [args.requests]
+
+        def worker():
+            sessions = {}
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                    user_id, method, path, kwargs = self.request_for(endpoint)
+                session = sessions.get(user_id)
+                if session is None:
+                    session = sessions[user_id] = self.client(user_id) if user_id else requests.Session()
+                started = time.perf_counter()
+                try:
+                    response = session.request(method, self.base_url + path, timeout=60, **kwargs)
+                    ok = response.status_code < 400 or (endpoint == "order" and response.status_code in (400, 409))
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return summarize(latencies, errors[0], time.perf_counter() - started)
+
+    def run(self):
+        self.setup()
+        try:
+            results = {}
+            for endpoint in self.args.endpoints:
+                before = {name: stub.requests for name, stub in self.stubs.items()}
+                results[endpoint] = self.run_endpoint(endpoint)
+                results[endpoint]["upstream_requests"] = {
+                    name: stub.requests - before[name] for name, stub in self.stubs.items()
+                }
+                print(format_row(endpoint, results[endpoint]))
+            return results
+        finally:
+            self.teardown()
+
+
+def format_row(name, r):
+    return (
+        f"{name:<20} {r['requests']:>6} req  {r['errors']:>4} err  {r['throughput_rps'] or 0:>9.1f} rps  "
+        f"p50 {r['p50_ms'] or 0:>8.2f}ms  p95 {r['p95_ms'] or 0:>8.2f}ms  p99 {r['p99_ms'] or 0:>8.2f}ms"
+    )
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(base_path, new_path):
+    base = json.loads(Path(base_path).read_text())["results"]
+    new = json.loads(Path(new_path).read_text())["results"]
+    print(f"{'endpoint':<20} {'metric':<15} {'base':>10} {'new':>10} {'change':>9}")
+    for endpoint in new:
+        if endpoint not in base:
+            continue
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            a, b = base[endpoint].get(metric), new[endpoint].get(metric)
+            if not a or b is None:
+                continue
+            print(f"{endpoint:<20} {metric:<15} {a:>10.2f} {b:>10.2f} {(b - a) / a * 100:>+8.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Load test the app against a seeded dataset and local upstream stubs.")
+    sub = parser.add_subparsers(dest="command")
+    run = sub.add_parser("run", help="seed a dataset, start stubs and drive the routes")
+    run.add_argument("--users", type=int, default=20000)
+    run.add_argument("--projects-per-user", type=int, default=3)
+    run.add_argument("--orders", type=int, default=20000)
+    run.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    run.add_argument("--concurrency", type=int, default=16)
+    run.add_argument("--latency-ms", type=float, default=50, help="added latency for every upstream stub")
+    run.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS)
+    run.add_argument("--with-hour-sync", action="store_true", help="run the background hour sync during the benchmark")
+    run.add_argument("--workdir", help="directory for the seeded databases (default: a new temp dir)")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--out", help="write results JSON here")
+    cmp_parser = sub.add_parser("compare", help="compare two results files")
+    cmp_parser.add_argument("base")
+    cmp_parser.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        compare(args.base, args.new)
+        return 0
+    if args.command != "run":
+        parser.print_help()
+        return 1
+
+    bench = Bench(args)
+    results = bench.run()
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("command", "out")},
+        "dataset": bench.dataset,
+        "results": results,
+    }
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import random
+import db
+import admin_db
+
+STATUSES = ["Building"] * 6 + ["Pending Review"] * 2 + ["Shipped"] * 2
+
+
+def hackatime_names(user_index: int, project_index: int):
+    return [f"u{user_index}-p{project_index}-a", f"u{user_index}-p{project_index}-b"]
+
+
+def slack_id(user_index: int) -> str:
+    return f"UB{user_index:07d}"
+
+
+def seed(users: int, projects_per_user: int, orders: int, rewards: int = 30, faqs: int = 20, seed_value: int = 1):
+    # Builds users.db / admin.db at db.DB_NAME / admin_db.ADMIN_DB_NAME, which must be empty.
+    rng = random.Random(seed_value)
+    db.init_db()
+    admin_db.init_db()
+
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO users (id, email, nickname, slack_id) VALUES (?, ?, ?, ?)",
+            [(i, f"bench{i}@example.com", f"bench{i}", slack_id(i)) for i in range(1, users + 1)],
+        )
+        # Balances come from ledger entries, whose trigger fills in users.hours
+        conn.executemany(
+            "INSERT INTO hours_ledger (user_id, delta, kind, note) VALUES (?, ?, 'opening', 'bench seed')",
+            [(i, rng.uniform(0, 200)) for i in range(1, users + 1)],
+        )
+        project_rows = []
+        link_rows = []
+        project_id = 0
+        for user_index in range(1, users + 1):
+            for project_index in range(projects_per_user):
+                project_id += 1
+                names = hackatime_names(user_index, project_index)
+                project_rows.append((
+                    project_id,
+                    user_index,
+                    f"Project {user_index}-{project_index}",
+                    "A synthetic project used for benchmarking. " * 4,
+                    "https://example.com/demo",
+                    "https://github.com/example/repo",
+                    ",".join(names),
+                    rng.uniform(0, 40),
+                    rng.choice(STATUSES),
+                ))
+                link_rows.extend((project_id, user_index, name) for name in names)
+        conn.executemany(
+            """INSERT INTO projects
+            (id, user_id, title, description, demo_link, github_link, hackatime_project, hours, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            project_rows,
+        )
+        conn.executemany(
+            "INSERT INTO project_hackatime_links (project_id, user_id, name) VALUES (?, ?, ?)",
+            link_rows,
+        )
+        conn.executemany(
+            """INSERT INTO orders (user_id, reward_id, quantity, name, email, phone, address, status, total_cost)
+            VALUES (?, ?, 1, 'Bench User', 'bench@example.com', '', ?, ?, ?)""",
+            [
+                (
+                    rng.randint(1, users),
+                    rng.randint(1, rewards),
+                    '{"address": "1 Example St", "suburb": "Town", "postcode": "1234", "state": "ST", "country": "AU"}',
+                    rng.choice(["pending", "fulfilled"]),
+                    rng.uniform(1, 20),
+                )
+                for _ in range(orders)
+            ],
+        )
+        conn.execute("ANALYZE")
+
+    with admin_db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO rewards (name, description, cost, image_url) VALUES (?, ?, ?, ?)",
+            [(f"Reward {i}", "A reward", 1 + i % 10, "https://example.com/r.png") for i in range(rewards)],
+        )
+        conn.executemany(
+            "INSERT INTO faqs (question, answer) VALUES (?, ?)",
+            [(f"Question {i}?", "Answer.") for i in range(faqs)],
+        )
+
+    return {
+        "users": users,
+        "projects": project_id,
+        "orders": orders,
+        "rewards": rewards,
+        "faqs": faqs,
+    }
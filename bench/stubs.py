@@ -0,0 +1,193 @@
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from bench import dataset
+
+
+class StubServer:
+    # A local HTTP server that answers every request through `handle(method, path, body)`
+    # after sleeping `latency` seconds.
+
+    def __init__(self, handle, latency: float = 0.0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub.lock:
+                    stub.requests += 1
+                status, payload = handle(self.command, urlparse(self.path).path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def hackatime_handler(method, path, body):
+    # /api/v1/users/<slack_id>/stats
+    parts = path.strip("/").split("/")
+    slack_id = parts[3] if len(parts) > 3 else ""
+    try:
+        user_index = int(slack_id.lstrip("UB"))
+    except ValueError:
+        user_index = 0
+    projects = [
+        {"name": name, "total_seconds": 3600 + (user_index * 37 + p * 11) % 7200}
+        for p in range(4)
+        for name in dataset.hackatime_names(user_index, p)
+    ]
+    return 200, {"data": {"projects": projects}}
+
+
+def slack_handler(method, path, body):
+    return 200, {"ok": True, "ts": str(time.time())}
+
+
+AUTH_ISSUER = "bench-auth"
+AUTH_KID = "bench-key"
+_rsa_key = None
+_rsa_lock = threading.Lock()
+
+
+def _is_probable_prime(n: int, rounds: int = 20) -> bool:
+    if n % 2 == 0:
+        return n == 2
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for _ in range(rounds):
+        x = pow(random.randrange(2, n - 1), d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _random_prime(bits: int) -> int:
+    while True:
+        candidate = random.getrandbits(bits) | (1 << (bits - 1)) | 1
+        if _is_probable_prime(candidate):
+            return candidate
+
+
+def rsa_key():
+    # (n, e, d) for signing the stub's ID tokens; generated once per run, stdlib only
+    global _rsa_key
+    with _rsa_lock:
+        if _rsa_key is None:
+            e = 65537
+            while True:
+                p, q = _random_prime(1024), _random_prime(1024)
+                phi = (p - 1) * (q - 1)
+                if p != q and phi % e:
+                    break
+            _rsa_key = (p * q, e, pow(e, -1, phi))
+        return _rsa_key
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _int_b64(value: int) -> str:
+    return _b64(value.to_bytes((value.bit_length() + 7) // 8, "big"))
+
+
+def sign_id_token(claims: dict) -> str:
+    n, _, d = rsa_key()
+    size = (n.bit_length() + 7) // 8
+    header = _b64(json.dumps({"alg": "RS256", "typ": "JWT", "kid": AUTH_KID}).encode())
+    payload = _b64(json.dumps(claims).encode())
+    digest_info = bytes.fromhex("3031300d060960864801650304020105000420") + hashlib.sha256(f"{header}.{payload}".encode()).digest()
+    padded = b"\x00\x01" + b"\xff" * (size - len(digest_info) - 3) + b"\x00" + digest_info
+    signature = pow(int.from_bytes(padded, "big"), d, n).to_bytes(size, "big")
+    return f"{header}.{payload}.{_b64(signature)}"
+
+
+def _userinfo():
+    return {
+        "email": "bench1@example.com",
+        "nickname": "bench1",
+        "slack_id": dataset.slack_id(1),
+        "verification_status": "verified",
+        "ysws_eligible": True,
+    }
+
+
+_id_token = (0, None)
+
+
+def _bench_id_token() -> str:
+    # Signing is a pure-Python 2048-bit modexp that holds the GIL in the benchmark
+    # process, so one token is reused for a minute
+    global _id_token
+    issued, token = _id_token
+    now = int(time.time())
+    if token is None or now - issued >= 60:
+        claims = dict(_userinfo(), iss=AUTH_ISSUER, aud="bench", sub="1", iat=now, exp=now + 300)
+        token = sign_id_token(claims)
+        _id_token = (now, token)
+    return token
+
+
+def auth_handler(method, path, body):
+    if path.endswith("/oauth/token"):
+        return 200, {"access_token": "bench-token", "token_type": "Bearer", "id_token": _bench_id_token()}
+    if path.endswith("/oauth/discovery/keys"):
+        n, e, _ = rsa_key()
+        return 200, {"keys": [{"kty": "RSA", "use": "sig", "alg": "RS256", "kid": AUTH_KID, "n": _int_b64(n), "e": _int_b64(e)}]}
+    if path.endswith("/oauth/userinfo"):
+        return 200, _userinfo()
+    return 404, {"error": "not_found"}
+
+
+def start_all(latency: float):
+    rsa_key()
+    return {
+        "hackatime": StubServer(hackatime_handler, latency).start(),
+        "slack": StubServer(slack_handler, latency).start(),
+        "auth": StubServer(auth_handler, latency).start(),
+    }
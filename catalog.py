@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+import admin_db
+import cooperative
+
+# How often (seconds) to ask admin.db whether another connection or process has written to it
+CHECK_INTERVAL = 1.0
+
+
+# Snapshots are shared by every request until the next reload, so each row is a
+# read-only mapping; callers that need a dict take a copy (see get_reward)
+class Snapshot(NamedTuple):
+    faqs: tuple
+    rewards: tuple
+    rewards_by_id: Mapping[int, Mapping[str, Any]]
+    faqs_version: int
+    rewards_version: int
+
+
+_snapshot: Optional[Snapshot] = None
+_lock = threading.Lock()
+_watch = None
+_watch_key = None
+_data_version = None
+_checked_at = 0.0
+
+
+def _load() -> Snapshot:
+    faqs_version = admin_db.get_change_version("faqs")
+    rewards_version = admin_db.get_change_version("rewards")
+    faqs = tuple(MappingProxyType(f) for f in admin_db.get_all_faqs())
+    rewards = tuple(MappingProxyType(r) for r in admin_db.get_all_rewards())
+    return Snapshot(
+        faqs=faqs,
+        rewards=rewards,
+        rewards_by_id=MappingProxyType({r["id"]: r for r in rewards}),
+        faqs_version=faqs_version,
+        rewards_version=rewards_version,
+    )
+
+
+def _poll_data_version() -> int:
+    # PRAGMA data_version only moves for commits made by *other* connections, so the
+    # catalog keeps a private connection that never writes.
+    global _watch, _watch_key
+    key = (os.getpid(), admin_db.ADMIN_DB_NAME)
+    if _watch is None or _watch_key != key:
+        _watch = sqlite3.connect(admin_db.ADMIN_DB_NAME, check_same_thread=False)
+        _watch_key = key
+    return _watch.execute("PRAGMA data_version").fetchone()[0]
+
+
+def _refresh(force: bool = False):
+    global _snapshot, _data_version, _checked_at
+    with _lock:
+        data_version = cooperative.run(_poll_data_version)
+        if force or _snapshot is None or data_version != _data_version:
+            _snapshot = _load()
+            _data_version = data_version
+        _checked_at = time.monotonic()
+
+
+def snapshot() -> Snapshot:
+    if _snapshot is None or time.monotonic() - _checked_at >= CHECK_INTERVAL:
+        _refresh()
+    return _snapshot
+
+
+def invalidate():
+    _refresh(force=True)
+
+
+def get_reward(reward_id: int) -> Optional[Dict[str, Any]]:
+    reward = snapshot().rewards_by_id.get(reward_id)
+    return dict(reward) if reward else None
@@ -0,0 +1,105 @@
+import functools
+import inspect
+import os
+from typing import Callable, List, Tuple
+
+# Native threads that run SQLite (and other blocking C) calls for a gevent worker
+DB_THREADS = int(os.getenv("DB_THREADS", 8))
+
+# (capture, restore) pairs that carry per-request state from the calling greenlet into
+# the pool thread for the duration of a call; see metrics.install()
+context_hooks: List[Tuple[Callable[[], object], Callable[[object], None]]] = []
+
+_pool = None
+_native = None
+
+
+def active() -> bool:
+    # True inside a gevent worker (gunicorn -k gevent), which monkey-patches threading
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def _get_pool():
+    global _pool, _native
+    if _pool is None:
+        from gevent import monkey
+        from gevent.threadpool import ThreadPool
+        _native = monkey.get_original("threading", "local")()
+        _pool = ThreadPool(DB_THREADS)
+    return _pool
+
+
+def _run(fn, contexts, args, kwargs):
+    saved = [capture() for capture, _ in context_hooks]
+    for (_, restore), context in zip(context_hooks, contexts):
+        restore(context)
+    _native.busy = True
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _native.busy = False
+        for (_, restore), context in zip(context_hooks, saved):
+            restore(context)
+
+
+def _in_pool() -> bool:
+    _get_pool()
+    return getattr(_native, "busy", False)
+
+
+def run(fn, *args, **kwargs):
+    # Runs fn on the native pool under a gevent worker and returns its result; calls
+    # made from inside the pool (one db function calling another) run inline
+    if not active() or _in_pool():
+        return fn(*args, **kwargs)
+    contexts = [capture() for capture, _ in context_hooks]
+    return _get_pool().apply(_run, (fn, contexts, args, kwargs))
+
+
+def _offloaded(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return run(fn, *args, **kwargs)
+
+    wrapper._cooperative = True
+    return wrapper
+
+
+def _pool_only(fn):
+    # A transaction entered on the event loop would block it, and the db functions
+    # called inside would run on pool threads with connections of their own
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _in_pool():
+            raise RuntimeError(
+                f"{fn.__module__}.{fn.__name__}() entered outside the database pool; "
+                "wrap the block in a function and call it through cooperative.run()"
+            )
+        return fn(*args, **kwargs)
+
+    wrapper._cooperative = True
+    return wrapper
+
+
+def offload_module(module, context_managers=()):
+    # The event loop must never block on SQLite (busy_timeout waits can last seconds),
+    # so each public function of the module runs on the native pool while the calling
+    # greenlet yields. Functions returning context managers can't move there and may
+    # only be entered from code that already runs on the pool. Generators stay put and
+    # must do their queries through offloaded functions.
+    if not active():
+        return
+    for name, fn in inspect.getmembers(module, inspect.isfunction):
+        if fn.__module__ != module.__name__ or name.startswith("_"):
+            continue
+        if inspect.isgeneratorfunction(fn) or getattr(fn, "_cooperative", False):
+            continue
+        if name in context_managers:
+            setattr(module, name, _pool_only(fn))
+        else:
+            setattr(module, name, _offloaded(fn))
+
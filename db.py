@@ -1,101 +1,675 @@
 import sqlite3
-from contextlib import contextmanager
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Iterator
+import hashlib
 import json
+import time
+from sqlite_pool import ConnectionManager
+from migrations import Backfill, Migration, migrate
 
 DB_NAME = "users.db"
 
-@contextmanager
+_connections = ConnectionManager(lambda: DB_NAME)
+
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+    return _connections.transaction()
+
+
+def transaction(immediate: bool = False):
+    return _connections.transaction(immediate)
+
+def _table_exists(c, name: str) -> bool:
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return c.fetchone() is not None
+
+
+def _add_missing_columns(c, table: str, columns: Dict[str, str]):
+    c.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in c.fetchall()}
+    for name, decl in columns.items():
+        if name not in existing:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+
+# Migrations 1-5 predate versioning and also bring up databases created by the old
+# init_db, which may already hold any of their tables; keep them idempotent.
+# Later migrations run exactly once and can assume the previous version's schema.
+
+
+def _migrate_base_tables(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        email TEXT UNIQUE NOT NULL,
+        nickname TEXT,
+        slack_id TEXT,
+        hours REAL DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    _add_missing_columns(c, "users", {"hours": "REAL DEFAULT 0"})
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS projects (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        demo_link TEXT,
+        github_link TEXT,
+        hackatime_project TEXT,
+        hours REAL DEFAULT 0,
+        paid_hours REAL DEFAULT 0,
+        status TEXT DEFAULT 'Building',
+        image_url TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    """)
+    _add_missing_columns(c, "projects", {"paid_hours": "REAL DEFAULT 0", "image_url": "TEXT"})
+
+    c.execute("DROP INDEX IF EXISTS idx_projects_user_id")
+    c.execute("DROP INDEX IF EXISTS idx_projects_status")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_projects_user_created ON projects(user_id, created_at)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_projects_status_created ON projects(status, created_at)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_projects_created ON projects(created_at)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_projects_user_hours ON projects(user_id, hours)"
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_slack_id ON users(slack_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)")
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        reward_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 1,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        phone TEXT,
+        address TEXT,
+        status TEXT DEFAULT 'pending',
+        notes TEXT,
+        total_cost REAL NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    """)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at)"
+    )
+
+    # Remaining stock per reward; rewards without a row are unlimited. Kept here rather
+    # than in admin.db so reservations commit in the same transaction as the order.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS reward_stock (
+        reward_id INTEGER PRIMARY KEY,
+        remaining INTEGER NOT NULL CHECK (remaining >= 0)
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS order_idempotency_keys (
+        user_id INTEGER NOT NULL,
+        key TEXT NOT NULL,
+        request_hash TEXT NOT NULL,
+        order_id INTEGER NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, key)
+    ) WITHOUT ROWID
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS slack_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        blocks TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        sent_at DATETIME
+    )
+    """)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_slack_outbox_pending ON slack_outbox(status, next_attempt_at)"
+    )
+
+
+def _migrate_stats(c):
+    backfill_stats = not _table_exists(c, "app_counters")
+    _create_stats_tables(c)
+    _create_version_tables(c)
+    if backfill_stats:
+        _rebuild_stats(c)
+
+
+def _migrate_ledger(c):
+    _create_ledger_tables(c, open_balances=not _table_exists(c, "hours_ledger"))
+
+
+def _migrate_hackatime_links(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS project_hackatime_links (
+        project_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        PRIMARY KEY (project_id, name),
+        FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE
+    )
+    """)
+    c.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_hackatime_links_user_name ON project_hackatime_links(user_id, name)"
+    )
+
+
+def _create_stats_tables(c):
+    # Counters kept current by triggers so stats reads never aggregate over projects/users.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS app_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS project_status_stats (
+        status TEXT PRIMARY KEY,
+        project_count INTEGER NOT NULL DEFAULT 0,
+        hours REAL NOT NULL DEFAULT 0
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS user_project_stats (
+        user_id INTEGER PRIMARY KEY,
+        project_count INTEGER NOT NULL DEFAULT 0,
+        hours REAL NOT NULL DEFAULT 0
+    )
+    """)
+    c.execute("INSERT OR IGNORE INTO app_counters (name, value) VALUES ('users', 0), ('users_with_projects', 0)")
+
+    add_project = """
+        INSERT INTO project_status_stats (status, project_count, hours)
+        VALUES (NEW.status, 1, COALESCE(NEW.hours, 0))
+        ON CONFLICT(status) DO UPDATE SET
+            project_count = project_count + 1, hours = hours + excluded.hours;
+        INSERT INTO user_project_stats (user_id, project_count, hours)
+        VALUES (NEW.user_id, 1, COALESCE(NEW.hours, 0))
+        ON CONFLICT(user_id) DO UPDATE SET
+            project_count = project_count + 1, hours = hours + excluded.hours;
+    """
+    remove_project = """
+        UPDATE project_status_stats SET
+            project_count = project_count - 1, hours = hours - COALESCE(OLD.hours, 0)
+        WHERE status = OLD.status;
+        UPDATE user_project_stats SET
+            project_count = project_count - 1, hours = hours - COALESCE(OLD.hours, 0)
+        WHERE user_id = OLD.user_id;
+    """
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_projects_stats_insert AFTER INSERT ON projects
+    BEGIN {add_project} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_projects_stats_delete AFTER DELETE ON projects
+    BEGIN {remove_project} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_projects_stats_update
+    AFTER UPDATE OF status, hours, user_id ON projects
+    BEGIN {remove_project} {add_project} END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_users_count_insert AFTER INSERT ON users
+    BEGIN UPDATE app_counters SET value = value + 1 WHERE name = 'users'; END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_users_count_delete AFTER DELETE ON users
+    BEGIN UPDATE app_counters SET value = value - 1 WHERE name = 'users'; END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_user_stats_insert AFTER INSERT ON user_project_stats
+    WHEN NEW.project_count > 0
+    BEGIN UPDATE app_counters SET value = value + 1 WHERE name = 'users_with_projects'; END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_user_stats_update AFTER UPDATE OF project_count ON user_project_stats
+    WHEN (OLD.project_count > 0) != (NEW.project_count > 0)
+    BEGIN
+        UPDATE app_counters
+        SET value = value + (CASE WHEN NEW.project_count > 0 THEN 1 ELSE -1 END)
+        WHERE name = 'users_with_projects';
+    END
+    """)
+
+
+def _create_version_tables(c):
+    # Change counters used as HTTP validators: 'projects' moves on any project write,
+    # 'projects:<status>' when a project with that status is added, changed or removed.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS change_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    bump = """
+        INSERT INTO change_versions (name, version) VALUES {values}
+        ON CONFLICT(name) DO UPDATE SET version = version + 1;
+    """
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_projects_version_insert AFTER INSERT ON projects
+    BEGIN {bump.format(values="('projects', 1), ('projects:' || NEW.status, 1)")} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_projects_version_delete AFTER DELETE ON projects
+    BEGIN {bump.format(values="('projects', 1), ('projects:' || OLD.status, 1)")} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_projects_version_update AFTER UPDATE ON projects
+    BEGIN {bump.format(values="('projects', 1), ('projects:' || OLD.status, 1), ('projects:' || NEW.status, 1)")} END
+    """)
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_reward_stock_version_{event.lower()} AFTER {event} ON reward_stock
+        BEGIN {bump.format(values="('reward_stock', 1)")} END
+        """)
 
-def init_db():
+
+def _create_change_log(c):
+    # Row-level change feed read by the /api/events stream; pruned to the newest
+    # CHANGE_LOG_KEEP entries by prune_change_log.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS change_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        user_id INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    log = "INSERT INTO change_log (entity, entity_id, action, user_id) VALUES ({values});"
+    project_update_action = (
+        "CASE WHEN NEW.status IS NOT OLD.status THEN 'status' "
+        "WHEN NEW.paid_hours IS NOT OLD.paid_hours THEN 'paid' ELSE 'updated' END"
+    )
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_projects_log_insert AFTER INSERT ON projects
+    BEGIN {log.format(values="'project', NEW.id, 'created', NEW.user_id")} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_projects_log_update AFTER UPDATE ON projects
+    BEGIN {log.format(values=f"'project', NEW.id, {project_update_action}, NEW.user_id")} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_projects_log_delete AFTER DELETE ON projects
+    BEGIN {log.format(values="'project', OLD.id, 'deleted', OLD.user_id")} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_orders_log_insert AFTER INSERT ON orders
+    BEGIN {log.format(values="'order', NEW.id, 'created', NEW.user_id")} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_orders_log_status AFTER UPDATE OF status ON orders
+    BEGIN {log.format(values="'order', NEW.id, 'status', NEW.user_id")} END
+    """)
+
+
+CHANGE_LOG_KEEP = 50000
+
+
+def get_changes(after_id: int, limit: int = 500) -> List[Dict[str, Any]]:
     with get_db_connection() as conn:
         c = conn.cursor()
+        c.execute(
+            "SELECT id, entity, entity_id, action, user_id FROM change_log WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        )
+        return [dict(row) for row in c.fetchall()]
 
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            email TEXT UNIQUE NOT NULL,
-            nickname TEXT,
-            slack_id TEXT,
-            hours REAL DEFAULT 0,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+
+def get_change_log_bounds() -> tuple:
+    # (oldest retained id, newest id); (0, 0) when empty
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        # Separate subqueries so each is a single b-tree seek
+        c.execute(
+            "SELECT COALESCE((SELECT MIN(id) FROM change_log), 0), COALESCE((SELECT MAX(id) FROM change_log), 0)"
         )
-        """)
+        row = c.fetchone()
+        return row[0], row[1]
 
-        c.execute("PRAGMA table_info(users)")
-        user_columns = {row[1] for row in c.fetchall()}
 
-        if "hours" not in user_columns:
-            c.execute("ALTER TABLE users ADD COLUMN hours REAL DEFAULT 0")
+def prune_change_log(keep: int = CHANGE_LOG_KEEP) -> int:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "DELETE FROM change_log WHERE id <= (SELECT MAX(id) FROM change_log) - ?", (keep,)
+        )
+        return c.rowcount
 
+
+def get_change_version(name: str) -> int:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT version FROM change_versions WHERE name = ?", (name,))
+        row = c.fetchone()
+        return row[0] if row else 0
+
+
+def _expected_stats(c) -> Dict[str, Any]:
+    c.execute("SELECT COUNT(*) FROM users")
+    users = c.fetchone()[0]
+    c.execute("SELECT status, COUNT(*), COALESCE(SUM(hours), 0) FROM projects GROUP BY status")
+    by_status = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+    c.execute("SELECT user_id, COUNT(*), COALESCE(SUM(hours), 0) FROM projects GROUP BY user_id")
+    by_user = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+    return {
+        "counters": {"users": users, "users_with_projects": len(by_user)},
+        "status": by_status,
+        "user": by_user,
+    }
+
+
+def _stored_stats(c) -> Dict[str, Any]:
+    c.execute("SELECT name, value FROM app_counters")
+    counters = {row[0]: row[1] for row in c.fetchall()}
+    c.execute("SELECT status, project_count, hours FROM project_status_stats WHERE project_count != 0")
+    by_status = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+    c.execute("SELECT user_id, project_count, hours FROM user_project_stats WHERE project_count != 0")
+    by_user = {row[0]: (row[1], row[2]) for row in c.fetchall()}
+    return {"counters": counters, "status": by_status, "user": by_user}
+
+
+def _rebuild_stats(c):
+    expected = _expected_stats(c)
+    c.execute("DELETE FROM project_status_stats")
+    c.execute("DELETE FROM user_project_stats")
+    c.executemany(
+        "INSERT INTO project_status_stats (status, project_count, hours) VALUES (?, ?, ?)",
+        [(status, n, h) for status, (n, h) in expected["status"].items()],
+    )
+    c.executemany(
+        "INSERT INTO user_project_stats (user_id, project_count, hours) VALUES (?, ?, ?)",
+        [(user_id, n, h) for user_id, (n, h) in expected["user"].items()],
+    )
+    # Set after the inserts above, whose triggers bump users_with_projects
+    c.executemany(
+        "UPDATE app_counters SET value = ? WHERE name = ?",
+        [(value, name) for name, value in expected["counters"].items()],
+    )
+
+
+def check_stats(repair: bool = False) -> List[str]:
+    with transaction(immediate=repair) as conn:
+        c = conn.cursor()
+        expected = _expected_stats(c)
+        stored = _stored_stats(c)
+        drift = []
+        for name, value in expected["counters"].items():
+            if stored["counters"].get(name) != value:
+                drift.append(f"counter {name}: stored {stored['counters'].get(name)}, actual {value}")
+        for scope in ("status", "user"):
+            for key in expected[scope].keys() | stored[scope].keys():
+                want = expected[scope].get(key, (0, 0))
+                have = stored[scope].get(key, (0, 0))
+                if want[0] != have[0] or abs(want[1] - have[1]) > 1e-6:
+                    drift.append(
+                        f"{scope} {key}: stored {have[0]} projects / {have[1]:.4f}h, "
+                        f"actual {want[0]} projects / {want[1]:.4f}h"
+                    )
+        if drift and repair:
+            _rebuild_stats(c)
+        return drift
+
+
+def _create_ledger_tables(c, open_balances: bool = False):
+    # Append-only history of every balance change; users.hours is a cache of its sum,
+    # kept current by trigger. Snapshots hold each user's balance as of the ledger id
+    # stored in app_counters, so reconciliation only aggregates entries after it.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS hours_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        delta REAL NOT NULL,
+        kind TEXT NOT NULL,
+        ref_type TEXT,
+        ref_id INTEGER,
+        note TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hours_ledger_user ON hours_ledger(user_id, id)")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS hours_snapshots (
+        user_id INTEGER PRIMARY KEY,
+        balance REAL NOT NULL,
+        ledger_id INTEGER NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    if open_balances:
+        # Existing balances predate the ledger; record them as opening entries before
+        # the balance trigger exists so they aren't applied twice.
         c.execute("""
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            description TEXT,
-            demo_link TEXT,
-            github_link TEXT,
-            hackatime_project TEXT,
-            hours REAL DEFAULT 0,
-            paid_hours REAL DEFAULT 0,
-            status TEXT DEFAULT 'Building',
-            image_url TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-        )
+        INSERT INTO hours_ledger (user_id, delta, kind, note)
+        SELECT id, hours, 'opening', 'balance before ledger' FROM users WHERE COALESCE(hours, 0) != 0
         """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_hours_ledger_balance AFTER INSERT ON hours_ledger
+    BEGIN
+        UPDATE users SET hours = COALESCE(hours, 0) + NEW.delta WHERE id = NEW.user_id;
+    END
+    """)
+    for event in ("UPDATE", "DELETE"):
+        c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_hours_ledger_no_{event.lower()} BEFORE {event} ON hours_ledger
+        BEGIN
+            SELECT RAISE(ABORT, 'hours_ledger is append-only');
+        END
+        """)
+    c.execute("INSERT OR IGNORE INTO app_counters (name, value) VALUES ('hours_snapshot_ledger_id', 0)")
+
 
-        c.execute("PRAGMA table_info(projects)")
-        project_columns = {row[1] for row in c.fetchall()}
+def _record_hours(c, user_id: int, delta: float, kind: str, ref_type: Optional[str] = None, ref_id: Optional[int] = None, note: Optional[str] = None):
+    c.execute(
+        "INSERT INTO hours_ledger (user_id, delta, kind, ref_type, ref_id, note) VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, delta, kind, ref_type, ref_id, note),
+    )
+
+
+def get_hours_ledger(user_id: int, limit: int = 100, before_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            """SELECT id, delta, kind, ref_type, ref_id, note, created_at FROM hours_ledger
+            WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?""",
+            (user_id, before_id if before_id is not None else 2**63 - 1, limit),
+        )
+        return [dict(row) for row in c.fetchall()]
 
-        if "paid_hours" not in project_columns:
-            c.execute("ALTER TABLE projects ADD COLUMN paid_hours REAL DEFAULT 0")
-        
-        if "image_url" not in project_columns:
-            c.execute("ALTER TABLE projects ADD COLUMN image_url TEXT")
 
+def snapshot_hours_balances() -> int:
+    # Folds ledger entries written since the last snapshot into hours_snapshots.
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        c.execute("SELECT value FROM app_counters WHERE name = 'hours_snapshot_ledger_id'")
+        since = c.fetchone()[0]
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM hours_ledger")
+        upto = c.fetchone()[0]
+        if upto <= since:
+            return 0
         c.execute(
-            "CREATE INDEX IF NOT EXISTS idx_projects_user_id ON projects(user_id)"
+            """INSERT INTO hours_snapshots (user_id, balance, ledger_id)
+            SELECT l.user_id, SUM(l.delta), MAX(l.id) FROM hours_ledger l
+            WHERE l.id > ? AND l.id <= ?
+            GROUP BY l.user_id
+            ON CONFLICT(user_id) DO UPDATE SET
+                balance = balance + excluded.balance,
+                ledger_id = excluded.ledger_id,
+                created_at = CURRENT_TIMESTAMP""",
+            (since, upto),
         )
+        updated = c.rowcount
         c.execute(
-            "CREATE INDEX IF NOT EXISTS idx_projects_status ON projects(status)"
+            "UPDATE app_counters SET value = ? WHERE name = 'hours_snapshot_ledger_id'", (upto,)
         )
+        return updated
 
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            reward_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL DEFAULT 1,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT,
-            address TEXT,
-            status TEXT DEFAULT 'pending',
-            notes TEXT,
-            total_cost REAL NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-        )
-        """)
 
-        conn.commit()
+def reconcile_balances(repair: bool = False, full: bool = False) -> List[str]:
+    # Recomputes every balance in one aggregate pass: snapshot plus newer ledger entries,
+    # or the whole ledger with full=True. repair rewrites drifted users.hours values.
+    with transaction(immediate=repair) as conn:
+        c = conn.cursor()
+        if full:
+            since, opening, snapshot_join = 0, "0", ""
+        else:
+            c.execute("SELECT value FROM app_counters WHERE name = 'hours_snapshot_ledger_id'")
+            since = c.fetchone()[0]
+            opening = "COALESCE(s.balance, 0)"
+            snapshot_join = "LEFT JOIN hours_snapshots s ON s.user_id = u.id"
+        c.execute(
+            f"""SELECT u.id, COALESCE(u.hours, 0), {opening} + COALESCE(t.delta, 0)
+            FROM users u
+            {snapshot_join}
+            LEFT JOIN (
+                SELECT user_id, SUM(delta) AS delta FROM hours_ledger WHERE id > ? GROUP BY user_id
+            ) t ON t.user_id = u.id""",
+            (since,),
+        )
+        drifted = [(row[0], row[1], row[2]) for row in c.fetchall() if abs(row[1] - row[2]) > 1e-6]
+        if drifted and repair:
+            c.executemany("UPDATE users SET hours = ? WHERE id = ?", [(want, uid) for uid, _, want in drifted])
+    if drifted and repair:
+        invalidate_cached_user()
+    return [f"user {uid}: cached {have:.4f}h, ledger {want:.4f}h" for uid, have, want in drifted]
+
+
+def _backfill_hackatime_links(c, lo: int, hi: int):
+    # Older projects stored links only as a comma separated string; the first project to claim a name keeps it.
+    c.execute(
+        "SELECT id, user_id, hackatime_project FROM projects WHERE id > ? AND id <= ? AND hackatime_project IS NOT NULL AND hackatime_project != '' ORDER BY id",
+        (lo, hi),
+    )
+    rows = [
+        (row["id"], row["user_id"], name)
+        for row in c.fetchall()
+        for name in split_hackatime_names(row["hackatime_project"])
+    ]
+    c.executemany(
+        "INSERT OR IGNORE INTO project_hackatime_links (project_id, user_id, name) VALUES (?, ?, ?)",
+        rows,
+    )
+
+
+def _migrate_session_epochs(c):
+    # Signed sessions carry a snapshot of the user row stamped with its session_epoch.
+    # Any change to a snapshotted column moves the row to the next value of a global
+    # counter, so processes can pick up every bump since the last one they saw.
+    c.execute("ALTER TABLE users ADD COLUMN session_epoch INTEGER NOT NULL DEFAULT 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_session_epoch ON users(session_epoch)")
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_users_session_epoch
+    AFTER UPDATE OF email, nickname, slack_id, hours ON users
+    WHEN NEW.email IS NOT OLD.email OR NEW.nickname IS NOT OLD.nickname
+        OR NEW.slack_id IS NOT OLD.slack_id OR NEW.hours IS NOT OLD.hours
+    BEGIN
+        INSERT INTO change_versions (name, version) VALUES ('sessions', 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1;
+        UPDATE users SET session_epoch = (SELECT version FROM change_versions WHERE name = 'sessions')
+        WHERE id = NEW.id;
+    END
+    """)
+
+
+def _index_sent_slack_messages(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_slack_outbox_sent ON slack_outbox(status, sent_at)")
+
+
+def _index_order_idempotency_keys(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_order_idempotency_keys_created ON order_idempotency_keys(created_at)")
+
+
+MIGRATIONS = [
+    Migration(1, "base tables", _migrate_base_tables),
+    Migration(2, "stats counters and change versions", _migrate_stats),
+    Migration(3, "change log", _create_change_log),
+    Migration(4, "hours ledger", _migrate_ledger),
+    Migration(
+        5,
+        "hackatime project links",
+        _migrate_hackatime_links,
+        Backfill("projects", _backfill_hackatime_links),
+    ),
+    Migration(6, "session epochs", _migrate_session_epochs),
+    Migration(7, "sent slack message index", _index_sent_slack_messages),
+    Migration(8, "idempotency key age index", _index_order_idempotency_keys),
+]
+
+
+def init_db() -> List[str]:
+    return migrate(transaction, MIGRATIONS)
+
+
+class HackatimeProjectConflict(Exception):
+    def __init__(self, conflicts: List[str]):
+        super().__init__(f"Hackatime project(s) already linked: {', '.join(conflicts)}")
+        self.conflicts = conflicts
+
+
+def split_hackatime_names(value: Optional[str]) -> List[str]:
+    names = []
+    for name in (value or "").split(","):
+        nm = name.strip()
+        if nm and nm not in names:
+            names.append(nm)
+    return names
+
+
+def _set_hackatime_links(c, project_id: int, value: Optional[str]):
+    names = split_hackatime_names(value)
+    c.execute("DELETE FROM project_hackatime_links WHERE project_id = ?", (project_id,))
+    if not names:
+        return
+    try:
+        c.executemany(
+            """INSERT INTO project_hackatime_links (project_id, user_id, name)
+            SELECT id, user_id, ? FROM projects WHERE id = ?""",
+            [(name, project_id) for name in names],
+        )
+    except sqlite3.IntegrityError:
+        c.execute("SELECT user_id FROM projects WHERE id = ?", (project_id,))
+        user_id = c.fetchone()[0]
+        raise HackatimeProjectConflict(
+            _linked_hackatime_names(c, user_id, names, exclude_project_id=project_id)
+        )
 
 
-        
+def _linked_hackatime_names(c, user_id: int, names: List[str], exclude_project_id: Optional[int] = None) -> List[str]:
+    if not names:
+        return []
+    placeholders = ", ".join("?" for _ in names)
+    c.execute(
+        f"""SELECT name FROM project_hackatime_links
+        WHERE user_id = ? AND name IN ({placeholders}) AND project_id != ?""",
+        (user_id, *names, exclude_project_id or 0),
+    )
+    linked = {row[0] for row in c.fetchall()}
+    return [n for n in names if n in linked]
 
 
 def get_or_create_user(
@@ -122,6 +696,24 @@ def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
         return dict(result) if result else None
 
 
+# Called with the user id (None for all users) after this process writes something a
+# session snapshot holds, so sessions.py can recheck epochs without waiting
+user_change_hooks: List[Callable[[Optional[int]], None]] = []
+
+
+def get_session_epochs(after: int = 0) -> List[tuple]:
+    # (user id, session_epoch) for every user whose epoch moved past `after`
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, session_epoch FROM users WHERE session_epoch > ?", (after,))
+        return [(row[0], row[1]) for row in c.fetchall()]
+
+
+def invalidate_cached_user(user_id: Optional[int] = None):
+    for hook in user_change_hooks:
+        hook(user_id)
+
+
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     with get_db_connection() as conn:
         c = conn.cursor()
@@ -151,15 +743,24 @@ def update_user(
         if slack_id is not None:
             updates.append("slack_id = ?")
             params.append(slack_id)
-        if hours is not None:
-            updates.append("hours = ?")
-            params.append(hours)
-        if not updates:
+        if not updates and hours is None:
             return False
-        params.append(user_id)
-        query = f"UPDATE users SET {', '.join(updates)} WHERE id = ?"
-        c.execute(query, params)
-        return c.rowcount > 0
+        updated = False
+        if updates:
+            params.append(user_id)
+            query = f"UPDATE users SET {', '.join(updates)} WHERE id = ?"
+            c.execute(query, params)
+            updated = c.rowcount > 0
+        if hours is not None:
+            # Balance changes go through the ledger as an adjustment to the requested value
+            c.execute(
+                """INSERT INTO hours_ledger (user_id, delta, kind, note)
+                SELECT id, ? - COALESCE(hours, 0), 'adjustment', 'balance set' FROM users WHERE id = ?""",
+                (hours, user_id),
+            )
+            updated = c.rowcount > 0
+    invalidate_cached_user(user_id)
+    return updated
 
 
 def get_all_users() -> List[Dict[str, Any]]:
@@ -198,7 +799,9 @@ def create_project(
                 image_url,
             ),
         )
-        return c.lastrowid
+        project_id = c.lastrowid
+        _set_hackatime_links(c, project_id, hackatime_project)
+        return project_id
 
 
 def get_project_by_id(project_id: int) -> Optional[Dict[str, Any]]:
@@ -209,6 +812,22 @@ def get_project_by_id(project_id: int) -> Optional[Dict[str, Any]]:
         return dict(result) if result else None
 
 
+def get_projects_by_ids(project_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    # Projects with their author's slack_id/nickname/email, keyed by id
+    if not project_ids:
+        return {}
+    placeholders = ", ".join("?" for _ in project_ids)
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            f"""SELECT p.*, u.slack_id, u.nickname, u.email FROM projects p
+            LEFT JOIN users u ON u.id = p.user_id
+            WHERE p.id IN ({placeholders})""",
+            list(project_ids),
+        )
+        return {row["id"]: dict(row) for row in c.fetchall()}
+
+
 def get_user_projects(
     user_id: int, status: Optional[str] = None
 ) -> List[Dict[str, Any]]:
@@ -277,14 +896,19 @@ def update_project(
         params.append(project_id)
         query = f"UPDATE projects SET {', '.join(updates)} WHERE id = ?"
         c.execute(query, params)
-        return c.rowcount > 0
+        updated = c.rowcount > 0
+        if updated and hackatime_project is not None:
+            _set_hackatime_links(c, project_id, hackatime_project)
+        return updated
 
 
 def delete_project(project_id: int) -> bool:
     with get_db_connection() as conn:
         c = conn.cursor()
         c.execute("DELETE FROM projects WHERE id = ?", (project_id,))
-        return c.rowcount > 0
+        deleted = c.rowcount > 0
+        c.execute("DELETE FROM project_hackatime_links WHERE project_id = ?", (project_id,))
+        return deleted
 
 
 def check_project_owner(project_id: int, user_id: int) -> bool:
@@ -295,14 +919,84 @@ def check_project_owner(project_id: int, user_id: int) -> bool:
         return result is not None and result[0] == user_id
 
 
-def update_project_status(project_id: int, status: str) -> bool:
-    return update_project(project_id, status=status)
+def update_project_status(
+    project_id: int, status: str, notifications: Optional[List[tuple]] = None
+) -> bool:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("UPDATE projects SET status = ? WHERE id = ?", (status, project_id))
+        if c.rowcount == 0:
+            return False
+        _enqueue_slack_messages(c, notifications or [])
+        return True
+
+
+def set_project_statuses(
+    project_ids: List[int],
+    status: str,
+    notifications: Optional[Dict[int, List[tuple]]] = None,
+    from_status: Optional[str] = None,
+) -> List[int]:
+    # Bulk form of update_project_status: one UPDATE for every id, and only the
+    # projects it actually changed get their notifications queued.
+    if not project_ids:
+        return []
+    placeholders = ", ".join("?" for _ in project_ids)
+    params = [status, *project_ids]
+    query = f"UPDATE projects SET status = ? WHERE id IN ({placeholders})"
+    if from_status is not None:
+        query += " AND status = ?"
+        params.append(from_status)
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        c.execute(query + " RETURNING id", params)
+        updated = [row[0] for row in c.fetchall()]
+        notifications = notifications or {}
+        _enqueue_slack_messages(c, [m for pid in updated for m in notifications.get(pid, [])])
+    return updated
 
 
 def update_project_hours(project_id: int, hours: float) -> bool:
     return update_project(project_id, hours=hours)
 
 
+def set_project_hours_bulk(updates: List[tuple]) -> int:
+    # updates: (project_id, hours) pairs; projects that left Building since they were read are skipped
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.executemany(
+            "UPDATE projects SET hours = ? WHERE id = ? AND status = 'Building'",
+            [(hours, project_id) for project_id, hours in updates],
+        )
+        return c.rowcount
+
+
+def get_hour_sync_targets(user_ids: Optional[List[int]] = None) -> Dict[int, Dict[str, Any]]:
+    query = """SELECT p.id, p.user_id, p.hours, u.slack_id, l.name
+        FROM projects p
+        JOIN users u ON u.id = p.user_id
+        LEFT JOIN project_hackatime_links l ON l.project_id = p.id
+        WHERE p.status = 'Building' AND u.slack_id IS NOT NULL"""
+    params = []
+    if user_ids:
+        query += f" AND p.user_id IN ({', '.join('?' for _ in user_ids)})"
+        params.extend(user_ids)
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(query, params)
+        targets: Dict[int, Dict[str, Any]] = {}
+        for row in c.fetchall():
+            user = targets.setdefault(
+                row["user_id"], {"slack_id": row["slack_id"], "projects": {}}
+            )
+            project = user["projects"].setdefault(
+                row["id"], {"hours": row["hours"] or 0, "names": []}
+            )
+            if row["name"]:
+                project["names"].append(row["name"])
+        return targets
+
+
 def add_project_hours(project_id: int, hours: float) -> bool:
     with get_db_connection() as conn:
         c = conn.cursor()
@@ -313,28 +1007,67 @@ def add_project_hours(project_id: int, hours: float) -> bool:
         return c.rowcount > 0
 
 
-def get_all_projects(status: Optional[str] = None) -> List[Dict[str, Any]]:
+PROJECT_LIST_COLUMNS = {
+    "id": "p.id",
+    "user_id": "p.user_id",
+    "title": "p.title",
+    "description": "p.description",
+    "demo_link": "p.demo_link",
+    "github_link": "p.github_link",
+    "hackatime_project": "p.hackatime_project",
+    "hours": "p.hours",
+    "paid_hours": "p.paid_hours",
+    "status": "p.status",
+    "image_url": "p.image_url",
+    "created_at": "p.created_at",
+    "updated_at": "p.updated_at",
+    "nickname": "u.nickname",
+    "email": "u.email",
+    "slack_id": "u.slack_id",
+}
+
+
+def list_projects(
+    status: Optional[str] = None,
+    author_slack_id: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[tuple] = None,
+    fields: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    # Keyset pagination over (created_at, id); `cursor` is the last row of the previous page.
+    names = [f for f in (fields or PROJECT_LIST_COLUMNS) if f in PROJECT_LIST_COLUMNS]
+    for required in ("id", "created_at"):
+        if required not in names:
+            names.append(required)
+    columns = ", ".join(f"{PROJECT_LIST_COLUMNS[f]} AS {f}" for f in names)
+    where = []
+    params = []
+    if status:
+        where.append("p.status = ?")
+        params.append(status)
+    if author_slack_id:
+        where.append("p.user_id = (SELECT id FROM users WHERE slack_id = ?)")
+        params.append(author_slack_id)
+    if cursor:
+        where.append("(p.created_at, p.id) < (?, ?)")
+        params.extend(cursor)
+    query = f"SELECT {columns} FROM projects p JOIN users u ON p.user_id = u.id"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY p.created_at DESC, p.id DESC"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
     with get_db_connection() as conn:
         c = conn.cursor()
-        if status:
-            c.execute(
-                """SELECT p.*, u.nickname, u.email, u.slack_id
-                FROM projects p
-                JOIN users u ON p.user_id = u.id
-                WHERE p.status = ?
-                ORDER BY p.created_at DESC""",
-                (status,),
-            )
-        else:
-            c.execute(
-                """SELECT p.*, u.nickname, u.email, u.slack_id
-                FROM projects p
-                JOIN users u ON p.user_id = u.id
-                ORDER BY p.created_at DESC"""
-            )
+        c.execute(query, params)
         return [dict(row) for row in c.fetchall()]
 
 
+def get_all_projects(status: Optional[str] = None) -> List[Dict[str, Any]]:
+    return list_projects(status=status)
+
+
 def count_projects(user_id: Optional[int] = None, status: Optional[str] = None) -> int:
     with get_db_connection() as conn:
         c = conn.cursor()
@@ -344,105 +1077,193 @@ def count_projects(user_id: Optional[int] = None, status: Optional[str] = None)
                 (user_id, status),
             )
         elif user_id:
-            c.execute("SELECT COUNT(*) FROM projects WHERE user_id = ?", (user_id,))
+            c.execute("SELECT project_count FROM user_project_stats WHERE user_id = ?", (user_id,))
         elif status:
-            c.execute("SELECT COUNT(*) FROM projects WHERE status = ?", (status,))
+            c.execute("SELECT project_count FROM project_status_stats WHERE status = ?", (status,))
         else:
-            c.execute("SELECT COUNT(*) FROM projects")
-        return c.fetchone()[0]
+            c.execute("SELECT COALESCE(SUM(project_count), 0) FROM project_status_stats")
+        row = c.fetchone()
+        return row[0] if row else 0
 
 
 def get_total_hours(user_id: Optional[int] = None) -> float:
     with get_db_connection() as conn:
         c = conn.cursor()
         if user_id:
-            c.execute(
-                "SELECT COALESCE(SUM(hours), 0) FROM projects WHERE user_id = ?",
-                (user_id,),
-            )
+            c.execute("SELECT hours FROM user_project_stats WHERE user_id = ?", (user_id,))
         else:
-            c.execute("SELECT COALESCE(SUM(hours), 0) FROM projects")
-        return c.fetchone()[0]
+            c.execute("SELECT COALESCE(SUM(hours), 0) FROM project_status_stats")
+        row = c.fetchone()
+        return row[0] if row else 0
 
 
 def get_project_stats() -> Dict[str, Any]:
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute("SELECT COUNT(*) FROM projects")
-        total_projects = c.fetchone()[0]
-        c.execute("SELECT status, COUNT(*) FROM projects GROUP BY status")
-        status_counts = {row[0]: row[1] for row in c.fetchall()}
-        c.execute("SELECT COUNT(*) FROM users")
-        total_users = c.fetchone()[0]
-        c.execute("SELECT COUNT(DISTINCT user_id) FROM projects")
-        users_with_projects = c.fetchone()[0]
-        c.execute("SELECT COALESCE(SUM(hours), 0) FROM projects")
-        total_hours = c.fetchone()[0]
+        c.execute("SELECT name, value FROM app_counters")
+        counters = {row[0]: row[1] for row in c.fetchall()}
+        c.execute(
+            "SELECT status, project_count, hours FROM project_status_stats WHERE project_count != 0"
+        )
+        rows = c.fetchall()
         return {
-            "total_projects": total_projects,
-            "total_users": total_users,
-            "users_with_projects": users_with_projects,
-            "total_hours": total_hours,
-            "status_counts": status_counts,
+            "total_projects": sum(row[1] for row in rows),
+            "total_users": counters.get("users", 0),
+            "users_with_projects": counters.get("users_with_projects", 0),
+            "total_hours": sum(row[2] for row in rows),
+            "status_counts": {row[0]: row[1] for row in rows},
+        }
+
+
+def get_profile_stats(user_id: int) -> Dict[str, Any]:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT project_count, hours FROM user_project_stats WHERE user_id = ?", (user_id,)
+        )
+        row = c.fetchone()
+        return {
+            "project_count": row[0] if row else 0,
+            "total_hours": row[1] if row else 0,
         }
 
 
 def get_used_hackatime_projects(user_id: int, exclude_project_id: int = None) -> set:
     with get_db_connection() as conn:
         c = conn.cursor()
-        if exclude_project_id:
-            c.execute(
-                "SELECT hackatime_project FROM projects WHERE user_id = ? AND id != ?",
-                (user_id, exclude_project_id),
-            )
-        else:
-            c.execute(
-                "SELECT hackatime_project FROM projects WHERE user_id = ?", (user_id,)
-            )
-        rows = c.fetchall()
-        used = set()
-        for row in rows:
-            val = row["hackatime_project"]
-            if val:
-                for name in val.split(","):
-                    nm = name.strip()
-                    if nm:
-                        used.add(nm)
-        return used
+        c.execute(
+            "SELECT name FROM project_hackatime_links WHERE user_id = ? AND project_id != ?",
+            (user_id, exclude_project_id or 0),
+        )
+        return {row[0] for row in c.fetchall()}
 
 
 def check_hackatime_projects_available(
     used_id: int, desired_names: list, exclude_project_id: int = None
 ) -> list:
-    used = get_used_hackatime_projects(used_id, exclude_project_id)
-    conflicts = [n for n in desired_names if n in used]
-    return conflicts
+    with get_db_connection() as conn:
+        return _linked_hackatime_names(conn.cursor(), used_id, list(desired_names), exclude_project_id)
+
 
 def set_project_paid_hours(project_id: int, paid_hours: float) -> bool:
-    with get_db_connection() as conn:
+    # The payout credit is computed from paid_hours inside the write transaction, so
+    # concurrent payouts of the same project each record only their own difference.
+    with transaction(immediate=True) as conn:
         c = conn.cursor()
-        c.execute("SELECT paid_hours, user_id FROM projects WHERE id = ?", (project_id,))
+        c.execute(
+            """INSERT INTO hours_ledger (user_id, delta, kind, ref_type, ref_id)
+            SELECT user_id, ? - COALESCE(paid_hours, 0), 'payout', 'project', id FROM projects WHERE id = ?
+            RETURNING user_id""",
+            (paid_hours, project_id),
+        )
         row = c.fetchone()
         if not row:
             return False
-        prev_paid = row["paid_hours"] or 0
-        user_id = row["user_id"]
-        delta = paid_hours - prev_paid
+        user_id = row[0]
         c.execute("UPDATE projects SET paid_hours = ? WHERE id = ?", (paid_hours, project_id))
-        c.execute("UPDATE users SET hours = COALESCE(hours, 0) + ? WHERE id = ?", (delta, user_id))
-        return True
- 
-def create_order(user_id: int, reward_id: int, quantity: int, name: str, email: str, phone: str, address: dict, total_cost: float) -> int:
-    with get_db_connection() as conn:
+    invalidate_cached_user(user_id)
+    return True
+
+
+def set_project_paid_hours_bulk(payments: List[tuple]) -> List[int]:
+    # payments: (project_id, paid_hours) pairs; only Shipped projects are paid.
+    # Returns the ids that were paid.
+    if not payments:
+        return []
+    amounts = dict(payments)
+    placeholders = ", ".join("?" for _ in amounts)
+    with transaction(immediate=True) as conn:
         c = conn.cursor()
-        c.execute("UPDATE users SET hours = hours - ? WHERE id = ? AND hours >= ?", (total_cost, user_id, total_cost))
+        c.execute(
+            f"SELECT id, user_id FROM projects WHERE id IN ({placeholders}) AND status = 'Shipped'",
+            list(amounts),
+        )
+        rows = c.fetchall()
+        paid = [(amounts[row["id"]], row["id"]) for row in rows]
+        c.executemany(
+            """INSERT INTO hours_ledger (user_id, delta, kind, ref_type, ref_id)
+            SELECT user_id, ? - COALESCE(paid_hours, 0), 'payout', 'project', id FROM projects WHERE id = ?""",
+            paid,
+        )
+        c.executemany("UPDATE projects SET paid_hours = ? WHERE id = ?", paid)
+    for user_id in {row["user_id"] for row in rows}:
+        invalidate_cached_user(user_id)
+    return [project_id for _, project_id in paid]
+
+
+class OrderRejected(Exception):
+    # reason: 'insufficient_balance', 'out_of_stock' or 'idempotency_key_reused'
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def create_order(user_id: int, reward_id: int, quantity: int, name: str, email: str, phone: str, address: dict, total_cost: float, idempotency_key: Optional[str] = None) -> int:
+    # BEGIN IMMEDIATE takes the write lock up front, so the idempotency check, the stock and
+    # balance reservations and the insert can't interleave with another buyer. Each
+    # reservation is one conditional UPDATE; a failed one raises and rolls the others back.
+    request_hash = hashlib.sha256(json.dumps([reward_id, quantity, total_cost]).encode()).hexdigest()
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        if idempotency_key:
+            c.execute(
+                "SELECT order_id, request_hash FROM order_idempotency_keys WHERE user_id = ? AND key = ?",
+                (user_id, idempotency_key),
+            )
+            row = c.fetchone()
+            if row:
+                if row["request_hash"] != request_hash:
+                    raise OrderRejected("idempotency_key_reused")
+                return row["order_id"]
+
+        c.execute(
+            "UPDATE reward_stock SET remaining = remaining - ? WHERE reward_id = ? AND remaining >= ?",
+            (quantity, reward_id, quantity),
+        )
         if c.rowcount == 0:
-            return None
+            c.execute("SELECT 1 FROM reward_stock WHERE reward_id = ?", (reward_id,))
+            if c.fetchone():
+                raise OrderRejected("out_of_stock")
         c.execute(
             "INSERT INTO orders (user_id, reward_id, quantity, name, email, phone, address, total_cost) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
             (user_id, reward_id, quantity, name, email, phone, json.dumps(address or {}), total_cost),
         )
-        return c.lastrowid
+        order_id = c.lastrowid
+        c.execute(
+            """INSERT INTO hours_ledger (user_id, delta, kind, ref_type, ref_id)
+            SELECT id, ?, 'order', 'order', ? FROM users WHERE id = ? AND hours >= ?""",
+            (-total_cost, order_id, user_id, total_cost),
+        )
+        if c.rowcount == 0:
+            raise OrderRejected("insufficient_balance")
+        if idempotency_key:
+            c.execute(
+                "INSERT INTO order_idempotency_keys (user_id, key, request_hash, order_id) VALUES (?, ?, ?, ?)",
+                (user_id, idempotency_key, request_hash, order_id),
+            )
+    invalidate_cached_user(user_id)
+    return order_id
+
+
+def set_reward_stock(reward_id: int, remaining: Optional[int]):
+    # None removes the limit
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        if remaining is None:
+            c.execute("DELETE FROM reward_stock WHERE reward_id = ?", (reward_id,))
+        else:
+            c.execute(
+                """INSERT INTO reward_stock (reward_id, remaining) VALUES (?, ?)
+                ON CONFLICT(reward_id) DO UPDATE SET remaining = excluded.remaining""",
+                (reward_id, remaining),
+            )
+
+
+def get_reward_stock() -> Dict[int, int]:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT reward_id, remaining FROM reward_stock")
+        return {row[0]: row[1] for row in c.fetchall()}
 
 def get_orders_for_user(user_id: int):
     with get_db_connection() as conn:
@@ -472,6 +1293,20 @@ def get_all_orders():
         return rows
 
 
+def get_orders_by_ids(order_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    if not order_ids:
+        return {}
+    placeholders = ", ".join("?" for _ in order_ids)
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            f"""SELECT id, user_id, reward_id, quantity, status, total_cost, created_at
+            FROM orders WHERE id IN ({placeholders})""",
+            list(order_ids),
+        )
+        return {row["id"]: dict(row) for row in c.fetchall()}
+
+
 def get_order_by_id(order_id: int):
     with get_db_connection() as conn:
         c = conn.cursor()
@@ -483,7 +1318,8 @@ def get_order_by_id(order_id: int):
 def update_order_status(order_id: int, status: str) -> bool:
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute("UPDATE orders SET status = ? WHERE id = ?", (status, order_id))
+        # Refunds are final; refund_order owns that transition
+        c.execute("UPDATE orders SET status = ? WHERE id = ? AND status != 'refunded'", (status, order_id))
         return c.rowcount > 0
 
 
@@ -492,4 +1328,164 @@ def update_order_notes(order_id: int, notes: str) -> bool:
         c = conn.cursor()
         c.execute("UPDATE orders SET notes = ? WHERE id = ?", (notes, order_id))
         return c.rowcount > 0
-                                                                                                                                                                                                                                                                                                                                                                                                    
\ No newline at end of file
+
+
+def refund_order(order_id: int) -> bool:
+    # Credits the order's cost back through the ledger and returns its stock
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        c.execute(
+            """UPDATE orders SET status = 'refunded' WHERE id = ? AND status != 'refunded'
+            RETURNING user_id, reward_id, quantity, total_cost""",
+            (order_id,),
+        )
+        row = c.fetchone()
+        if not row:
+            return False
+        _record_hours(c, row["user_id"], row["total_cost"], "refund", "order", order_id)
+        c.execute(
+            "UPDATE reward_stock SET remaining = remaining + ? WHERE reward_id = ?",
+            (row["quantity"], row["reward_id"]),
+        )
+    invalidate_cached_user(row["user_id"])
+    return True
+
+
+def _enqueue_slack_messages(c, messages: List[tuple]):
+    c.executemany(
+        "INSERT INTO slack_outbox (channel, blocks) VALUES (?, ?)",
+        [(channel, json.dumps(blocks)) for channel, blocks in messages if channel],
+    )
+
+
+def enqueue_slack_messages(messages: List[tuple]):
+    with get_db_connection() as conn:
+        _enqueue_slack_messages(conn.cursor(), messages)
+
+
+def claim_slack_messages(limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+    now = time.time()
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            """UPDATE slack_outbox SET next_attempt_at = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM slack_outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id LIMIT ?
+            )
+            RETURNING *""",
+            (now + lease_seconds, now, limit),
+        )
+        rows = [dict(r) for r in c.fetchall()]
+        for r in rows:
+            r["blocks"] = json.loads(r["blocks"])
+        return sorted(rows, key=lambda r: r["id"])
+
+
+def mark_slack_message_sent(message_id: int) -> bool:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "UPDATE slack_outbox SET status = 'sent', last_error = NULL, sent_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (message_id,),
+        )
+        return c.rowcount > 0
+
+
+def retry_slack_message(message_id: int, error: str, delay: float, dead: bool = False) -> bool:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "UPDATE slack_outbox SET status = ?, last_error = ?, next_attempt_at = ? WHERE id = ?",
+            ("dead" if dead else "pending", error, time.time() + delay, message_id),
+        )
+        return c.rowcount > 0
+
+
+def release_slack_messages(message_ids: List[int], delay: float):
+    with get_db_connection() as conn:
+        conn.executemany(
+            "UPDATE slack_outbox SET attempts = attempts - 1, next_attempt_at = ? WHERE id = ?",
+            [(time.time() + delay, message_id) for message_id in message_ids],
+        )
+
+
+def prune_sent_slack_messages(older_than_seconds: float, limit: int = 1000) -> int:
+    # Delivered messages are only kept for inspection; dead letters stay until handled.
+    # Deletes at most `limit` rows per call so the write lock is held briefly.
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            """DELETE FROM slack_outbox WHERE id IN (
+                SELECT id FROM slack_outbox
+                WHERE status = 'sent' AND sent_at < datetime('now', ?)
+                LIMIT ?
+            )""",
+            (f"-{int(older_than_seconds)} seconds", limit),
+        )
+        return c.rowcount
+
+
+def prune_idempotency_keys(older_than_seconds: float, limit: int = 1000) -> int:
+    # Keys only need to outlive client retries; the orders they point at are kept.
+    # Deletes at most `limit` rows per call so the write lock is held briefly.
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            """DELETE FROM order_idempotency_keys WHERE (user_id, key) IN (
+                SELECT user_id, key FROM order_idempotency_keys
+                WHERE created_at < datetime('now', ?)
+                LIMIT ?
+            )""",
+            (f"-{int(older_than_seconds)} seconds", limit),
+        )
+        return c.rowcount
+
+
+def get_dead_slack_messages() -> List[Dict[str, Any]]:
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM slack_outbox WHERE status = 'dead' ORDER BY next_attempt_at, id")
+        return [dict(r) for r in c.fetchall()]
+
+
+EXPORT_QUERIES = {
+    "orders": """SELECT o.*, u.email AS user_email, u.nickname AS user_nickname, u.slack_id AS user_slack_id
+        FROM orders o JOIN users u ON o.user_id = u.id""",
+    "projects": """SELECT p.*, u.slack_id AS slack_id
+        FROM projects p JOIN users u ON p.user_id = u.id""",
+    "users": "SELECT u.* FROM users u",
+}
+EXPORT_ALIASES = {"orders": "o", "projects": "p", "users": "u"}
+
+
+def get_export_chunk(
+    kind: str, after_id: int = 0, since: Optional[str] = None, limit: int = 500,
+) -> List[Dict[str, Any]]:
+    alias = EXPORT_ALIASES[kind]
+    query = EXPORT_QUERIES[kind] + f" WHERE {alias}.id > ?"
+    if since:
+        query += f" AND {alias}.created_at >= ?"
+    query += f" ORDER BY {alias}.id LIMIT ?"
+    params = [after_id] + ([since] if since else []) + [limit]
+    with get_db_connection() as conn:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+
+def iter_export_rows(
+    kind: str,
+    since_id: Optional[int] = None,
+    since: Optional[str] = None,
+    chunk_size: int = 500,
+) -> Iterator[Dict[str, Any]]:
+    # Pages through the table by primary key so memory stays flat and no read
+    # transaction is held open between chunks. Each chunk is a separate call so
+    # it can run on the database pool under a gevent worker.
+    last_id = since_id or 0
+    while True:
+        rows = get_export_chunk(kind, last_id, since, chunk_size)
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1]["id"]
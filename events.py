@@ -0,0 +1,99 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+import cooperative
+import db
+
+# How often the watcher asks users.db whether anything committed
+POLL_INTERVAL = 0.5
+HEARTBEAT_INTERVAL = 15
+# Streams end after this long; EventSource reconnects with Last-Event-ID
+MAX_STREAM_SECONDS = 300
+RETRY_MS = 3000
+PRUNE_INTERVAL = 3600
+# Under thread-per-request workers (gthread, the dev server) every open stream holds a
+# thread for up to MAX_STREAM_SECONDS, so only this many may be open per process; the
+# rest get a 503 and the page polls instead. gevent workers have no such limit.
+THREAD_STREAMS = int(os.getenv("SSE_THREAD_STREAMS", 4))
+
+_cond = threading.Condition()
+_latest = 0
+_watcher = None
+_watcher_lock = threading.Lock()
+_stream_slots = threading.BoundedSemaphore(THREAD_STREAMS)
+
+
+def _poll(conn, data_version):
+    # (data_version, newest change id or None if nothing committed since data_version)
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if version == data_version:
+        return version, None
+    return version, conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+
+
+def _watch():
+    # One thread per process polls PRAGMA data_version on a private connection (it only
+    # moves when another connection commits) and wakes every open stream when the
+    # change log grows, so idle streams cost no queries.
+    global _latest
+    conn = None
+    key = None
+    data_version = None
+    next_prune = time.monotonic()
+    while True:
+        try:
+            if conn is None or key != (os.getpid(), db.DB_NAME):
+                conn = sqlite3.connect(db.DB_NAME, check_same_thread=False)
+                key = (os.getpid(), db.DB_NAME)
+                data_version = None
+            data_version, latest = cooperative.run(_poll, conn, data_version)
+            if latest is not None and latest != _latest:
+                with _cond:
+                    _latest = latest
+                    _cond.notify_all()
+            if time.monotonic() >= next_prune:
+                db.prune_change_log()
+                next_prune = time.monotonic() + PRUNE_INTERVAL
+        except Exception as e:
+            print(f"Change watcher error: {e}")
+            conn = None
+        time.sleep(POLL_INTERVAL)
+
+
+def _ensure_watcher():
+    global _watcher
+    if _watcher is not None and _watcher.is_alive():
+        return
+    with _watcher_lock:
+        if _watcher is None or not _watcher.is_alive():
+            _watcher = threading.Thread(target=_watch, name="change-watcher", daemon=True)
+            _watcher.start()
+
+
+def acquire_stream() -> bool:
+    return _stream_slots.acquire(blocking=False)
+
+
+def release_stream():
+    _stream_slots.release()
+
+
+def wait_for_changes(after_id: int, timeout: float) -> int:
+    # Blocks until the change log has entries past after_id or timeout passes;
+    # returns the newest known id.
+    _ensure_watcher()
+    with _cond:
+        _cond.wait_for(lambda: _latest > after_id, timeout)
+        return _latest
+
+
+def format_event(event: str, data, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,45 @@
+import importlib.util
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+wsgi_app = "wsgi:app"
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_WORKERS", min(4, os.cpu_count() or 1)))
+# gevent: requests waiting on Hackatime/OAuth/Slack (and open /api/events streams) are
+# greenlets rather than threads, so one worker holds hundreds of them; SQLite runs on a
+# native pool (cooperative.py). gthread is the fallback where gevent isn't installed.
+worker_class = os.getenv("WEB_WORKER_CLASS", "gevent" if importlib.util.find_spec("gevent") else "gthread")
+worker_connections = int(os.getenv("WEB_CONNECTIONS", 1000))
+threads = int(os.getenv("WEB_THREADS", 16))
+timeout = 60
+# Old workers finish in-flight requests on SIGHUP/SIGTERM; SSE clients reconnect
+graceful_timeout = 30
+keepalive = 5
+# The app is imported in each worker (not the master), so SIGHUP picks up new code
+preload_app = False
+chdir = str(ROOT)
+
+
+def _prepare():
+    # Schema init and migrations run once, before any worker exists. A child process
+    # keeps app/db out of the master's sys.modules, where forked workers would
+    # inherit the old code across reloads.
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"], cwd=ROOT, check=True)
+
+
+def on_starting(server):
+    _prepare()
+
+
+def on_reload(server):
+    _prepare()
+
+
+def worker_exit(server, worker):
+    app = sys.modules.get("app")
+    if app is not None:
+        app.stop_background_workers()
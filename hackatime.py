@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+import http_client
+
+HACKATIME_URL = os.getenv("HACKATIME_URL", "https://hackatime.hackclub.com").rstrip("/")
+STATS_URL = HACKATIME_URL + "/api/v1/users/{slack_id}/stats"
+
+CACHE_TTL = 60
+CACHE_STALE_TTL = 600
+CACHE_MAX_ENTRIES = 2048
+
+_cache = OrderedDict()
+_inflight = {}
+_lock = threading.Lock()
+
+
+class UnknownUser(Exception):
+    # Hackatime has no account for this Slack id. Cached like a result, so dashboards
+    # of users who never set Hackatime up don't cost an upstream call per load.
+    pass
+
+
+class _Fetch:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _fetch_stats(slack_id: str, start_date: str) -> Dict[str, Any]:
+    response = http_client.get(
+        STATS_URL.format(slack_id=slack_id),
+        params={"limit": 1000, "features": "projects", "start_date": start_date},
+    )
+    if response.status_code == 404:
+        return UnknownUser(f"No Hackatime user for {slack_id}")
+    response.raise_for_status()
+    return response.json()
+
+
+def _result(data) -> Dict[str, Any]:
+    if isinstance(data, UnknownUser):
+        raise data
+    return data
+
+
+def _store(key, data):
+    with _lock:
+        _cache[key] = (time.monotonic(), data)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def _run_fetch(key, fetch):
+    try:
+        fetch.result = _fetch_stats(*key)
+        _store(key, fetch.result)
+    except Exception as e:
+        fetch.error = e
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        fetch.done.set()
+
+
+def _start_fetch(key, background=False):
+    # Must be called with _lock held; joins an existing fetch for the same key if there is one.
+    fetch = _inflight.get(key)
+    if fetch is not None:
+        return fetch, False
+    fetch = _Fetch()
+    _inflight[key] = fetch
+    if background:
+        threading.Thread(target=_run_fetch, args=(key, fetch), daemon=True).start()
+    return fetch, True
+
+
+def get_stats(slack_id: str, start_date: str = "", fresh: bool = False) -> Dict[str, Any]:
+    key = (slack_id, start_date or "")
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry and not fresh:
+            _cache.move_to_end(key)
+            age = now - entry[0]
+            if age < CACHE_TTL:
+                return _result(entry[1])
+            if age < CACHE_STALE_TTL:
+                _start_fetch(key, background=True)
+                return _result(entry[1])
+        fetch, owner = _start_fetch(key)
+
+    if owner:
+        _run_fetch(key, fetch)
+    else:
+        fetch.done.wait()
+
+    if fetch.error is not None:
+        # Past CACHE_STALE_TTL the entry is too old to stand in for Hackatime
+        if entry and now - entry[0] < CACHE_STALE_TTL:
+            print(f"Hackatime fetch failed, serving stale stats: {fetch.error}")
+            return _result(entry[1])
+        raise fetch.error
+    return _result(fetch.result)
+
+
+def get_projects(slack_id: str, start_date: str = "", fresh: bool = False) -> List[Dict[str, Any]]:
+    return get_stats(slack_id, start_date, fresh).get("data", {}).get("projects", [])
+
+
+def invalidate(slack_id: Optional[str] = None):
+    with _lock:
+        if slack_id is None:
+            _cache.clear()
+            return
+        for key in [k for k in _cache if k[0] == slack_id]:
+            del _cache[key]
+
+
+def seconds_by_name(projects: List[Dict[str, Any]]) -> Dict[str, float]:
+    seconds = {}
+    for hp in projects:
+        name = hp.get("name")
+        if name not in seconds:
+            seconds[name] = hp.get("total_seconds", 0)
+    return seconds
+
+
+def total_seconds(seconds: Dict[str, float], names: List[str]) -> float:
+    return sum(seconds.get(name, 0) for name in names)
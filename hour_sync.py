@@ -0,0 +1,159 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import db
+import hackatime
+
+SYNC_INTERVAL = 300
+MAX_WORKERS = 4
+JITTER = 2.0
+# A full cycle's start times are spread over at most this long
+CYCLE_SPREAD = SYNC_INTERVAL / 2
+ACTIVE_WINDOW = 1800
+MIN_RESYNC = 60
+HOURS_TOLERANCE = 0.01
+# How often the worker folds new hours_ledger entries into the balance snapshots
+SNAPSHOT_INTERVAL = 3600
+
+_start_date = ""
+# Full cycles and snapshots run in one process only; the others just serve request_sync()
+_periodic = True
+_active: Dict[int, float] = {}
+_last_synced: Dict[int, float] = {}
+_pending = set()
+_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_worker = None
+
+
+def request_sync(user_id: int):
+    # Called from request handlers: records activity and queues a prompt sync for the user.
+    now = time.monotonic()
+    with _lock:
+        _active[user_id] = now
+        if now - _last_synced.get(user_id, 0) >= MIN_RESYNC:
+            _pending.add(user_id)
+            _wake.set()
+
+
+def _take_pending() -> List[int]:
+    # Clear the wake flag first: a request_sync() landing after this either has its
+    # user in the batch taken here or sets the flag again for the next wait
+    _wake.clear()
+    with _lock:
+        pending = list(_pending)
+        _pending.clear()
+    return pending
+
+
+def _sync_user(user_id: int, target: dict) -> List[tuple]:
+    try:
+        seconds = hackatime.seconds_by_name(
+            hackatime.get_projects(target["slack_id"], _start_date)
+        )
+    except Exception as e:
+        print(f"Hour sync failed for user {user_id}: {e}")
+        return []
+    updates = []
+    for project_id, project in target["projects"].items():
+        hours = hackatime.total_seconds(seconds, project["names"]) / 3600.0
+        if abs(project["hours"] - hours) > HOURS_TOLERANCE:
+            updates.append((project_id, hours))
+    with _lock:
+        _last_synced[user_id] = time.monotonic()
+    return updates
+
+
+def _sync_now(user_ids: List[int]) -> int:
+    targets = db.get_hour_sync_targets(user_ids)
+    updates = [u for uid, target in targets.items() for u in _sync_user(uid, target)]
+    if updates:
+        db.set_project_hours_bulk(updates)
+    return len(updates)
+
+
+def _start_offsets(count: int, jitter: float) -> List[float]:
+    # Each job starts at a random point of its own slot, in priority order, and the
+    # slots together span at most CYCLE_SPREAD
+    gap = min(jitter, CYCLE_SPREAD / count) if count else 0.0
+    return [i * gap + random.uniform(0, gap) for i in range(count)]
+
+
+def run_cycle(user_ids: Optional[List[int]] = None, jitter: float = JITTER) -> int:
+    targets = db.get_hour_sync_targets(user_ids)
+    now = time.monotonic()
+    # Recently active users first, so their dashboards catch up before the long tail
+    order = sorted(
+        targets,
+        key=lambda uid: -_active.get(uid, 0) if now - _active.get(uid, 0) < ACTIVE_WINDOW else 0,
+    )
+    # Jitter is applied here, by holding back submissions, so pool threads never sleep.
+    # Prompt syncs requested meanwhile go to the pool straight away.
+    futures = []
+    prompt = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for uid, offset in zip(order, _start_offsets(len(order), jitter)):
+            while not _stop.is_set():
+                delay = now + offset - time.monotonic()
+                if delay <= 0 or not _wake.wait(delay):
+                    break
+                pending = _take_pending()
+                if pending:
+                    prompt.append(pool.submit(_sync_now, pending))
+            if _stop.is_set():
+                break
+            futures.append(pool.submit(_sync_user, uid, targets[uid]))
+        updates = [u for future in futures for u in future.result()]
+    for future in prompt:
+        if future.exception() is not None:
+            print(f"Hour sync error: {future.exception()}")
+    if updates:
+        db.set_project_hours_bulk(updates)
+    return len(updates)
+
+
+def run(stop_event: threading.Event = _stop):
+    next_full = time.monotonic()
+    next_snapshot = time.monotonic()
+    while not stop_event.is_set():
+        pending = _take_pending()
+        try:
+            if _periodic and time.monotonic() >= next_full:
+                run_cycle()
+                next_full = time.monotonic() + SYNC_INTERVAL
+            elif pending:
+                _sync_now(pending)
+            if _periodic and time.monotonic() >= next_snapshot:
+                db.snapshot_hours_balances()
+                next_snapshot = time.monotonic() + SNAPSHOT_INTERVAL
+        except Exception as e:
+            print(f"Hour sync error: {e}")
+        _wake.wait(max(0.0, next_full - time.monotonic()) if _periodic else None)
+
+
+def start_worker(start_date: str = "", periodic: bool = True):
+    global _worker, _start_date, _periodic
+    _start_date = start_date or ""
+    _periodic = periodic
+    if _worker is not None and _worker.is_alive():
+        return _worker
+    _stop.clear()
+    _worker = threading.Thread(target=run, name="hour-sync", daemon=True)
+    _worker.start()
+    return _worker
+
+
+def enable_periodic():
+    global _periodic
+    _periodic = True
+    _wake.set()
+
+
+def stop_worker(timeout: float = 5.0):
+    _stop.set()
+    _wake.set()
+    if _worker is not None:
+        _worker.join(timeout)
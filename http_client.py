@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 20))
+HOST_CONCURRENCY = int(os.getenv("HTTP_HOST_CONCURRENCY", 16))
+HOST_WAIT_TIMEOUT = 5
+
+# Idempotent requests are retried on these statuses and on connection errors/timeouts.
+# 429 is not among them: its Retry-After can be minutes, and callers already have a
+# fallback (stale cache, outbox retry). Backoff sleeps happen without a host slot.
+RETRY_STATUSES = (502, 503, 504)
+RETRY_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+RETRIES = 2
+BACKOFF_FACTOR = 0.3
+
+# Per-host overrides for HOST_CONCURRENCY
+HOST_LIMITS: Dict[str, int] = {
+    "hackatime.hackclub.com": 8,
+}
+
+
+# Called as (netloc, seconds, status or None) after every outbound request (see metrics.py)
+response_hook: Optional[Callable[[str, float, Optional[int]], None]] = None
+
+
+class HostBusy(requests.exceptions.RequestException):
+    pass
+
+
+_session = None
+_session_lock = threading.Lock()
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+
+
+def _make_session() -> requests.Session:
+    # urllib3 only retries failed connects (nothing was sent, so any method is safe)
+    # and does so without sleeping; every other retry goes through request()
+    retry = Retry(
+        total=2,
+        connect=2,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0,
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _make_session()
+    return _session
+
+
+def _host_slot(host: str) -> threading.BoundedSemaphore:
+    slot = _host_slots.get(host)
+    if slot is None:
+        with _host_slots_lock:
+            slot = _host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(HOST_LIMITS.get(host, HOST_CONCURRENCY))
+                _host_slots[host] = slot
+    return slot
+
+
+def _send(method: str, url: str, host: str, kwargs) -> requests.Response:
+    slot = _host_slot(host)
+    if not slot.acquire(timeout=HOST_WAIT_TIMEOUT):
+        raise HostBusy(f"Too many concurrent requests to {host}")
+    started = time.perf_counter()
+    status = None
+    try:
+        response = get_session().request(method, url, **kwargs)
+        status = response.status_code
+        return response
+    finally:
+        slot.release()
+        if response_hook is not None:
+            response_hook(urlparse(url).netloc, time.perf_counter() - started, status)
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    host = urlparse(url).hostname or ""
+    retries = RETRIES if method.upper() in RETRY_METHODS else 0
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(BACKOFF_FACTOR * 2 ** (attempt - 1))
+        try:
+            response = _send(method, url, host, kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            continue
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+        response.close()
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
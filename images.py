@@ -0,0 +1,157 @@
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Dict, Optional
+from PIL import Image, ImageOps
+
+# Longest edge (px) of each variant
+VARIANTS = {"thumb": 320, "card": 800, "full": 1920}
+WEBP_QUALITY = 82
+MAX_PIXELS = 40_000_000
+WORKERS = int(os.getenv("IMAGE_WORKERS", min(2, os.cpu_count() or 1)))
+PROCESS_TIMEOUT = 10
+# Renders queued or running at once. Uploads beyond this are turned away instead of
+# holding a request worker in the queue.
+MAX_PENDING = WORKERS * 2
+
+# Leading bytes of each accepted format (WebP also needs "WEBP" at offset 8)
+MAGIC = {
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"\xff\xd8\xff": "jpg",
+    b"GIF87a": "gif",
+    b"GIF89a": "gif",
+    b"RIFF": "webp",
+}
+VARIANT_NAME = re.compile(r"^[0-9a-f]{32}-(thumb|card|full)\.webp$")
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class ImagesBusy(Exception):
+    # The render pool is saturated, too slow or broken; the upload can be retried
+    pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+def sniff(data: bytes) -> Optional[str]:
+    for magic, fmt in MAGIC.items():
+        if data.startswith(magic):
+            if fmt == "webp" and data[8:12] != b"WEBP":
+                return None
+            return fmt
+    return None
+
+
+def content_name(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _render(data: bytes, folder: str, name: str):
+    # Runs in a pool process. Re-encoding from pixels drops EXIF/ICC/XMP metadata;
+    # orientation is applied first so rotated phone photos stay upright.
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    try:
+        with Image.open(BytesIO(data)) as img:
+            # Pillow only raises DecompressionBombError past twice the limit
+            if img.size[0] * img.size[1] > MAX_PIXELS:
+                raise Image.DecompressionBombError("Image is too large")
+            img.seek(0)
+            img = ImageOps.exif_transpose(img)
+            img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P", "PA") else "RGB")
+    except Image.DecompressionBombError as e:
+        raise InvalidImage("Image is too large") from e
+    except Exception as e:
+        raise InvalidImage("Could not decode image") from e
+    for variant, edge in VARIANTS.items():
+        resized = img.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        out = BytesIO()
+        resized.save(out, "WEBP", quality=WEBP_QUALITY, method=4)
+        _write_atomic(os.path.join(folder, f"{name}-{variant}.webp"), out.getvalue())
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # forkserver children are forked from a clean single-threaded server rather than
+    # from the threaded app. They still import the main module by path, so a script
+    # that uploads images needs an `if __name__ == "__main__"` guard.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    ctx = multiprocessing.get_context("forkserver")
+                    ctx.set_forkserver_preload([__name__])
+                else:
+                    ctx = multiprocessing.get_context("spawn")
+                _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=ctx)
+    return _pool
+
+
+def process_upload(data: bytes, folder: str) -> Dict[str, str]:
+    # Returns {variant: filename}. Files are named by content hash, so re-uploads of
+    # the same bytes reuse the existing variants without decoding anything.
+    fmt = sniff(data)
+    if fmt is None:
+        raise InvalidImage("Unsupported image type")
+    name = content_name(data)
+    filenames = {variant: f"{name}-{variant}.webp" for variant in VARIANTS}
+    if not all(os.path.exists(os.path.join(folder, f)) for f in filenames.values()):
+        _render_in_pool(data, folder, name)
+    return filenames
+
+
+def _render_in_pool(data: bytes, folder: str, name: str):
+    # The slot is held until the render finishes, even if this request stops waiting
+    if not _pending.acquire(blocking=False):
+        raise ImagesBusy("Image processing is busy")
+    pool = _get_pool()
+    try:
+        future = pool.submit(_render, data, folder, name)
+    except BrokenProcessPool as e:
+        _pending.release()
+        _discard_pool(pool)
+        raise ImagesBusy("Image processing failed") from e
+    future.add_done_callback(lambda _: _pending.release())
+    try:
+        future.result(timeout=PROCESS_TIMEOUT)
+    except TimeoutError as e:
+        raise ImagesBusy("Image processing timed out") from e
+    except BrokenProcessPool as e:
+        # A worker died (e.g. OOM on a huge image); start a fresh pool next time
+        _discard_pool(pool)
+        raise ImagesBusy("Image processing failed") from e
+
+
+def is_content_addressed(filename: str) -> bool:
+    return bool(VARIANT_NAME.match(filename))
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown():
+    if _pool is not None:
+        _discard_pool(_pool)
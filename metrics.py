@@ -0,0 +1,243 @@
+import cProfile
+import functools
+import inspect
+import io
+import pstats
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+import cooperative
+import http_client
+import sqlite_pool
+
+# Latency buckets (seconds) shared by every histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# netloc -> short upstream name used in labels and Server-Timing; see name_upstream()
+UPSTREAM_NAMES: Dict[str, str] = {}
+
+_lock = threading.Lock()
+_histograms: Dict[tuple, list] = {}
+_counters: Dict[tuple, float] = {}
+_local = threading.local()
+
+_profile_rate = 0.0
+_profile_stats: Optional[pstats.Stats] = None
+_profile_samples = 0
+
+
+def _labels(**labels) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def observe(name: str, value: float, **labels):
+    key = (name, _labels(**labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                hist[0][i] += 1
+        hist[1] += value
+        hist[2] += 1
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = (name, _labels(**labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+# Per-request accounting
+
+
+def start_request():
+    _local.request = {
+        "started": time.perf_counter(),
+        "db_time": 0.0,
+        "db_queries": 0,
+        "http_time": {},
+        "profiler": None,
+    }
+    _local.db_depth = 0
+    _local.db_function = None
+    if _profile_rate and random.random() < _profile_rate:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return
+        _local.request["profiler"] = profiler
+
+
+def finish_request(endpoint: str, status: int) -> Optional[dict]:
+    req = getattr(_local, "request", None)
+    _local.request = None
+    if req is None:
+        return None
+    if req["profiler"] is not None:
+        req["profiler"].disable()
+        _add_profile(req["profiler"])
+    wall = time.perf_counter() - req["started"]
+    req["wall"] = wall
+    observe("http_request_duration_seconds", wall, endpoint=endpoint)
+    inc("http_requests_total", endpoint=endpoint, status=str(status))
+    return req
+
+
+def server_timing(req: dict) -> str:
+    parts = [f'db;dur={req["db_time"] * 1000:.2f};desc="{req["db_queries"]} queries"']
+    for upstream, seconds in req["http_time"].items():
+        parts.append(f"{re.sub(r'[^A-Za-z0-9_-]', '_', upstream)};dur={seconds * 1000:.2f}")
+    parts.append(f"total;dur={req['wall'] * 1000:.2f}")
+    return ", ".join(parts)
+
+
+# SQLite
+
+
+def on_statement(sql: str):
+    function = getattr(_local, "db_function", None) or "other"
+    inc("db_queries_total", function=function)
+    req = getattr(_local, "request", None)
+    if req is not None:
+        req["db_queries"] += 1
+
+
+def _timed_db_call(fn, name):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_local, "db_depth", 0)
+        if depth:
+            return fn(*args, **kwargs)
+        _local.db_depth = 1
+        _local.db_function = name
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            _local.db_depth = 0
+            _local.db_function = None
+            observe("db_call_duration_seconds", elapsed, function=name)
+            req = getattr(_local, "request", None)
+            if req is not None:
+                req["db_time"] += elapsed
+
+    wrapper._metrics_timed = True
+    return wrapper
+
+
+def instrument_module(module):
+    # Wraps the module's public functions so the outermost db call per stack is timed.
+    for name, fn in inspect.getmembers(module, inspect.isfunction):
+        if fn.__module__ != module.__name__ or name.startswith("_"):
+            continue
+        if inspect.isgeneratorfunction(fn) or getattr(fn, "_metrics_timed", False):
+            continue
+        setattr(module, name, _timed_db_call(fn, f"{module.__name__}.{name}"))
+
+
+# Outbound HTTP
+
+
+def name_upstream(url: str, name: str):
+    UPSTREAM_NAMES[urlparse(url).netloc] = name
+
+
+def record_upstream(netloc: str, elapsed: float, status: Optional[int]):
+    upstream = UPSTREAM_NAMES.get(netloc, netloc)
+    observe("upstream_request_duration_seconds", elapsed, upstream=upstream)
+    inc("upstream_requests_total", upstream=upstream, status=str(status or "error"))
+    req = getattr(_local, "request", None)
+    if req is not None:
+        req["http_time"][upstream] = req["http_time"].get(upstream, 0.0) + elapsed
+
+
+# Sampling profiler
+
+
+def set_profiling(rate: float):
+    global _profile_rate, _profile_stats, _profile_samples
+    with _lock:
+        _profile_rate = max(0.0, min(1.0, rate))
+        if not _profile_rate:
+            _profile_stats = None
+            _profile_samples = 0
+
+
+def _add_profile(profiler: cProfile.Profile):
+    global _profile_stats, _profile_samples
+    with _lock:
+        if _profile_stats is None:
+            _profile_stats = pstats.Stats(profiler)
+        else:
+            _profile_stats.add(profiler)
+        _profile_samples += 1
+
+
+def profile_report(limit: int = 40, sort: str = "cumulative") -> dict:
+    with _lock:
+        if _profile_stats is None:
+            return {"rate": _profile_rate, "samples": 0, "report": ""}
+        out = io.StringIO()
+        _profile_stats.stream = out
+        _profile_stats.sort_stats(sort).print_stats(limit)
+        return {"rate": _profile_rate, "samples": _profile_samples, "report": out.getvalue()}
+
+
+# Prometheus text exposition
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        histograms = {k: (list(v[0]), v[1], v[2]) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        for bound, n in zip(BUCKETS, buckets):
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', f'{bound:g}'),))} {n}")
+        lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def _capture_context():
+    return (getattr(_local, "request", None), getattr(_local, "db_depth", 0), getattr(_local, "db_function", None))
+
+
+def _restore_context(context):
+    _local.request, _local.db_depth, _local.db_function = context
+
+
+def install():
+    sqlite_pool.statement_hook = on_statement
+    http_client.response_hook = record_upstream
+    # Queries offloaded to the gevent db pool still count towards the calling request
+    if (_capture_context, _restore_context) not in cooperative.context_hooks:
+        cooperative.context_hooks.append((_capture_context, _restore_context))
@@ -0,0 +1,100 @@
+import sqlite3
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+# Pause between backfill chunks so requests waiting on the write lock get a turn
+BACKFILL_PAUSE = 0.01
+
+
+class Backfill(NamedTuple):
+    # step(c, lo, hi) handles the rows of `table` with lo < rowid <= hi. Each chunk
+    # commits on its own, so the write lock is only held for one chunk at a time.
+    table: str
+    step: Callable[[sqlite3.Cursor, int, int], None]
+    batch_size: int = 1000
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Cursor], None]
+    backfill: Optional[Backfill] = None
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _ensure_progress_table(c):
+    # Chunk watermark for a migration whose schema step committed but whose backfill
+    # has not finished; user_version only moves past it once the backfill is done.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS migration_backfills (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        last_id INTEGER NOT NULL DEFAULT 0,
+        max_id INTEGER NOT NULL
+    )
+    """)
+
+
+def _apply(transaction, migration: Migration) -> bool:
+    # Returns False if another process already applied it
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        if current_version(conn) >= migration.version:
+            return False
+        if migration.backfill is None:
+            migration.apply(c)
+            c.execute(f"PRAGMA user_version = {int(migration.version)}")
+            return True
+        _ensure_progress_table(c)
+        c.execute("SELECT 1 FROM migration_backfills WHERE version = ?", (migration.version,))
+        if c.fetchone() is None:
+            migration.apply(c)
+            # Rows written after this point go through code that already knows the new schema
+            c.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {migration.backfill.table}")
+            c.execute(
+                "INSERT INTO migration_backfills (version, name, max_id) VALUES (?, ?, ?)",
+                (migration.version, migration.name, c.fetchone()[0]),
+            )
+    _run_backfill(transaction, migration)
+    return True
+
+
+def _run_backfill(transaction, migration: Migration):
+    backfill = migration.backfill
+    while True:
+        with transaction(immediate=True) as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT last_id, max_id FROM migration_backfills WHERE version = ?",
+                (migration.version,),
+            )
+            row = c.fetchone()
+            if row is None:
+                return
+            last_id, max_id = row
+            if last_id >= max_id:
+                c.execute("DELETE FROM migration_backfills WHERE version = ?", (migration.version,))
+                c.execute(f"PRAGMA user_version = {int(migration.version)}")
+                return
+            hi = min(last_id + backfill.batch_size, max_id)
+            backfill.step(c, last_id, hi)
+            c.execute(
+                "UPDATE migration_backfills SET last_id = ? WHERE version = ?",
+                (hi, migration.version),
+            )
+        time.sleep(BACKFILL_PAUSE)
+
+
+def migrate(transaction, migrations: List[Migration]) -> List[str]:
+    # Brings the database up to the last migration and returns the names applied.
+    # An up-to-date database costs a single PRAGMA read.
+    with transaction() as conn:
+        version = current_version(conn)
+    applied = []
+    for migration in migrations:
+        if migration.version > version and _apply(transaction, migration):
+            applied.append(migration.name)
+    return applied
@@ -0,0 +1,109 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+import http_client
+
+# Keys are refetched at most this often when a token names an unknown kid
+JWKS_REFRESH_COOLDOWN = 60
+# ...and at least this often, so rotated-out keys stop being trusted
+JWKS_MAX_AGE = 24 * 3600
+CLOCK_LEEWAY = 60
+
+# DER prefix of the DigestInfo for SHA-256 (RFC 8017, section 9.2)
+SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
+
+_keys: Dict[str, tuple] = {}
+_fetched_at = 0.0
+_attempted_at: Optional[float] = None
+_lock = threading.Lock()
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _to_int(value: str) -> int:
+    return int.from_bytes(_b64decode(value), "big")
+
+
+def _fetch_keys(jwks_url: str):
+    global _keys, _fetched_at
+    response = http_client.get(jwks_url)
+    response.raise_for_status()
+    keys = {}
+    for jwk in response.json().get("keys", []):
+        if jwk.get("kty") != "RSA" or jwk.get("use", "sig") != "sig":
+            continue
+        keys[jwk.get("kid")] = (_to_int(jwk["n"]), _to_int(jwk["e"]))
+    _keys = keys
+    _fetched_at = time.monotonic()
+
+
+def _get_key(jwks_url: str, kid: Optional[str]) -> tuple:
+    global _attempted_at
+    # Known keys are served without the lock, so logins don't queue behind a refetch
+    key = _keys.get(kid)
+    if key is not None and time.monotonic() - _fetched_at < JWKS_MAX_AGE:
+        return key
+    with _lock:
+        now = time.monotonic()
+        key = _keys.get(kid)
+        if key is not None and now - _fetched_at < JWKS_MAX_AGE:
+            return key
+        # An unknown kid usually means the provider rotated keys. Refetch, but at most
+        # once per cooldown so bogus kids or a JWKS outage don't cost a call per login.
+        if _attempted_at is not None and now - _attempted_at < JWKS_REFRESH_COOLDOWN:
+            raise InvalidToken(f"Unknown signing key {kid!r}")
+        _attempted_at = now
+        _fetch_keys(jwks_url)
+        key = _keys.get(kid)
+        if key is None:
+            raise InvalidToken(f"Unknown signing key {kid!r}")
+        return key
+
+
+def _verify_rs256(signing_input: bytes, signature: bytes, key: tuple):
+    n, e = key
+    size = (n.bit_length() + 7) // 8
+    if len(signature) != size:
+        raise InvalidToken("Bad signature length")
+    decoded = pow(int.from_bytes(signature, "big"), e, n).to_bytes(size, "big")
+    digest_info = SHA256_DIGEST_INFO + hashlib.sha256(signing_input).digest()
+    expected = b"\x00\x01" + b"\xff" * (size - len(digest_info) - 3) + b"\x00" + digest_info
+    if not hmac.compare_digest(decoded, expected):
+        raise InvalidToken("Bad signature")
+
+
+def verify_id_token(token: str, jwks_url: str, audience: str, issuer: Optional[str] = None) -> Dict[str, Any]:
+    # Returns the claims of an RS256-signed ID token or raises InvalidToken.
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        claims = json.loads(_b64decode(payload_b64))
+        signature = _b64decode(signature_b64)
+    except (ValueError, TypeError) as e:
+        raise InvalidToken("Malformed token") from e
+    if header.get("alg") != "RS256":
+        raise InvalidToken(f"Unsupported alg {header.get('alg')!r}")
+    key = _get_key(jwks_url, header.get("kid"))
+    _verify_rs256(f"{header_b64}.{payload_b64}".encode(), signature, key)
+
+    now = time.time()
+    if not isinstance(claims.get("exp"), (int, float)) or claims["exp"] < now - CLOCK_LEEWAY:
+        raise InvalidToken("Token expired")
+    if isinstance(claims.get("iat"), (int, float)) and claims["iat"] > now + CLOCK_LEEWAY:
+        raise InvalidToken("Token issued in the future")
+    aud = claims.get("aud")
+    if audience not in (aud if isinstance(aud, list) else [aud]):
+        raise InvalidToken("Wrong audience")
+    if issuer is not None and claims.get("iss", "").rstrip("/") != issuer.rstrip("/"):
+        raise InvalidToken("Wrong issuer")
+    return claims
@@ -0,0 +1,120 @@
+import threading
+import time
+import db
+import slack
+
+BATCH_SIZE = 20
+POLL_INTERVAL = 2.0
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 900
+# Delivered messages are deleted after this long, checked every PRUNE_INTERVAL
+SENT_RETENTION = 7 * 24 * 3600
+PRUNE_INTERVAL = 3600
+PRUNE_BATCH = 1000
+# Order idempotency keys are pruned on the same cadence
+IDEMPOTENCY_KEY_RETENTION = 24 * 3600
+
+# Slack errors that will never succeed on retry
+PERMANENT_ERRORS = {
+    "channel_not_found",
+    "not_in_channel",
+    "is_archived",
+    "user_not_found",
+    "account_inactive",
+    "invalid_blocks",
+    "invalid_auth",
+    "msg_too_long",
+}
+
+_wake = threading.Event()
+_stop = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def notify():
+    _wake.set()
+
+
+def _backoff(attempts: int) -> float:
+    return min(BACKOFF_MAX, BACKOFF_BASE ** attempts)
+
+
+def deliver_batch() -> int:
+    messages = db.claim_slack_messages(BATCH_SIZE, LEASE_SECONDS)
+    for i, message in enumerate(messages):
+        result = slack.post_message(message["channel"], message["blocks"])
+        if result["ok"]:
+            db.mark_slack_message_sent(message["id"])
+            continue
+
+        error = result["error"] or "unknown_error"
+        if result["retry_after"] is not None:
+            # Rate limited: push this and every remaining message back without burning an attempt
+            db.release_slack_messages([m["id"] for m in messages[i:]], result["retry_after"])
+            return i
+
+        dead = error in PERMANENT_ERRORS or message["attempts"] >= MAX_ATTEMPTS
+        if dead:
+            print(f"Slack message {message['id']} dead-lettered: {error}")
+        db.retry_slack_message(message["id"], error, _backoff(message["attempts"]), dead=dead)
+    return len(messages)
+
+
+def _prune(prune_batch, retention: float) -> int:
+    pruned = 0
+    while True:
+        count = prune_batch(retention, PRUNE_BATCH)
+        pruned += count
+        if count < PRUNE_BATCH:
+            return pruned
+
+
+def prune_sent() -> int:
+    return _prune(db.prune_sent_slack_messages, SENT_RETENTION)
+
+
+def prune_idempotency_keys() -> int:
+    return _prune(db.prune_idempotency_keys, IDEMPOTENCY_KEY_RETENTION)
+
+
+def run(stop_event: threading.Event = _stop):
+    next_prune = time.monotonic()
+    while not stop_event.is_set():
+        try:
+            sent = deliver_batch()
+            if time.monotonic() >= next_prune:
+                prune_sent()
+                prune_idempotency_keys()
+                next_prune = time.monotonic() + PRUNE_INTERVAL
+        except Exception as e:
+            print(f"Slack outbox worker error: {e}")
+            sent = 0
+        if sent < BATCH_SIZE:
+            _wake.wait(POLL_INTERVAL)
+            _wake.clear()
+
+
+def start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return _worker
+        _stop.clear()
+        _worker = threading.Thread(target=run, name="slack-outbox", daemon=True)
+        _worker.start()
+        return _worker
+
+
+def stop_worker(timeout: float = 5.0):
+    _stop.set()
+    _wake.set()
+    if _worker is not None:
+        _worker.join(timeout)
+
+
+if __name__ == "__main__":
+    db.init_db()
+    run()
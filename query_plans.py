@@ -0,0 +1,230 @@
+import inspect
+import os
+import random
+import sys
+import tempfile
+import db
+import admin_db
+
+# Checks that every query issued by db.py / admin_db.py is served by an index.
+# Each workload call below runs against a seeded database with statement tracing on;
+# every traced statement is then run through EXPLAIN QUERY PLAN and any full table
+# scan or temp B-tree sort is reported. Run with: python query_plans.py
+
+SEED_USERS = 500
+SEED_PROJECTS_PER_USER = 4
+SEED_ORDERS = 1000
+SEED_REWARDS = 20
+SEED_FAQS = 20
+
+# Functions that don't issue queries of their own, only run at startup, or are full
+# recompute tools by design
+SKIP = {
+    "get_db_connection",
+    "get_admin_db_connection",
+    "transaction",
+    "init_db",
+    "invalidate_cached_user",
+    "split_hackatime_names",
+    "check_stats",
+    "reconcile_balances",
+}
+
+# Functions allowed a temp B-tree: snapshot_hours_balances groups only the ledger entries
+# written since the previous snapshot
+ALLOW_TEMP_BTREE = {"snapshot_hours_balances"}
+
+# Tables that hold a handful of rows by construction; scanning them is fine
+SMALL_TABLES = {"app_counters", "project_status_stats", "reward_stock"}
+
+STATUSES = ["Building", "Pending Review", "Shipped"]
+
+
+def seed():
+    random.seed(1)
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO users (email, nickname, slack_id, hours) VALUES (?, ?, ?, ?)",
+            [(f"user{i}@example.com", f"user{i}", f"U{i:06d}", 10) for i in range(SEED_USERS)],
+        )
+        conn.executemany(
+            """INSERT INTO projects (user_id, title, description, hackatime_project, hours, status)
+            VALUES (?, ?, ?, ?, ?, ?)""",
+            [
+                (u, f"project {u}-{j}", "desc", f"ht-{u}-{j}", random.random() * 20, random.choice(STATUSES))
+                for u in range(1, SEED_USERS + 1)
+                for j in range(SEED_PROJECTS_PER_USER)
+            ],
+        )
+        conn.executemany(
+            """INSERT INTO orders (user_id, reward_id, quantity, name, email, address, status, total_cost)
+            VALUES (?, ?, 1, 'n', 'e', '{}', ?, 1)""",
+            [
+                (random.randint(1, SEED_USERS), random.randint(1, SEED_REWARDS), random.choice(["pending", "fulfilled"]))
+                for _ in range(SEED_ORDERS)
+            ],
+        )
+    with admin_db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO faqs (question, answer) VALUES (?, ?)",
+            [(f"q{i}", f"a{i}") for i in range(SEED_FAQS)],
+        )
+        conn.executemany(
+            "INSERT INTO rewards (name, description, cost, image_url) VALUES (?, ?, ?, ?)",
+            [(f"r{i}", "d", i + 1, "x") for i in range(SEED_REWARDS)],
+        )
+    for manager in (db._connections, admin_db._connections):
+        manager.connection().execute("ANALYZE")
+
+
+def workload():
+    return [
+        (db.get_or_create_user, ("user1@example.com",)),
+        (db.get_user_by_id, (1,)),
+        (db.get_session_epochs, (0,)),
+        (db.get_user_by_email, ("user1@example.com",)),
+        (db.get_user_by_slack_id, ("U000001",)),
+        (db.update_user, (1, "nick")),
+        (db.get_all_users, ()),
+        (db.create_project, (1, "new project")),
+        (db.get_project_by_id, (1,)),
+        (db.get_user_projects, (1,)),
+        (db.get_user_projects, (1, "Building")),
+        (db.update_project, (1, "renamed")),
+        (db.check_project_owner, (1, 1)),
+        (db.update_project_status, (1, "Shipped", [("U000001", [])])),
+        (db.get_projects_by_ids, ([1, 2, 3],)),
+        (db.set_project_statuses, ([4, 5], "Shipped", {4: [("U000001", [])]}, "Pending Review")),
+        (db.set_project_statuses, ([6], "Building")),
+        (db.set_project_paid_hours_bulk, ([(4, 1.0), (5, 2.0), (6, 1.5)],)),
+        (db.update_project_hours, (1, 2.5)),
+        (db.add_project_hours, (1, 1.0)),
+        (db.set_project_hours_bulk, ([(5, 1.0), (6, 2.0)],)),
+        (db.get_hour_sync_targets, ()),
+        (db.get_hour_sync_targets, ([1, 2],)),
+        (db.list_projects, ()),
+        (db.list_projects, ("Shipped", None, 20, ("2100-01-01 00:00:00", 10**9), ["id", "title"])),
+        (db.list_projects, (None, "U000001", 20)),
+        (db.get_all_projects, ("Building",)),
+        (db.count_projects, ()),
+        (db.count_projects, (1,)),
+        (db.count_projects, (None, "Shipped")),
+        (db.count_projects, (1, "Shipped")),
+        (db.get_total_hours, ()),
+        (db.get_total_hours, (1,)),
+        (db.get_project_stats, ()),
+        (db.get_profile_stats, (1,)),
+        (db.get_used_hackatime_projects, (1,)),
+        (db.get_used_hackatime_projects, (1, 2)),
+        (db.check_hackatime_projects_available, (1, ["ht-1-0"])),
+        (db.check_hackatime_projects_available, (1, ["ht-1-0", "ht-1-1"], 1)),
+        (db.update_project, (3, None, None, None, None, "ht-1-2, renamed")),
+        (db.set_project_paid_hours, (1, 1.0)),
+        (db.set_reward_stock, (1, 5)),
+        (db.create_order, (1, 1, 1, "n", "e", "p", {}, 1.0)),
+        (db.create_order, (1, 1, 1, "n", "e", "p", {}, 1.0, "key-1")),
+        (db.create_order, (1, 1, 1, "n", "e", "p", {}, 1.0, "key-1")),
+        (db.get_reward_stock, ()),
+        (db.set_reward_stock, (1, None)),
+        (db.snapshot_hours_balances, ()),
+        (db.get_hours_ledger, (1,)),
+        (db.get_hours_ledger, (1, 20, 100)),
+        (db.refund_order, (1,)),
+        (db.update_user, (2, None, None, 50.0)),
+        (db.snapshot_hours_balances, ()),
+        (db.get_orders_for_user, (1,)),
+        (db.get_all_orders, ()),
+        (db.get_order_by_id, (1,)),
+        (db.update_order_status, (1, "fulfilled")),
+        (db.update_order_notes, (1, "note")),
+        (db.enqueue_slack_messages, ([("U000001", [])],)),
+        (db.claim_slack_messages, (10, 60)),
+        (db.mark_slack_message_sent, (1,)),
+        (db.retry_slack_message, (2, "err", 1)),
+        (db.release_slack_messages, ([2], 1)),
+        (db.get_dead_slack_messages, ()),
+        (db.prune_sent_slack_messages, (0,)),
+        (db.prune_idempotency_keys, (0,)),
+        (db.delete_project, (2,)),
+        (admin_db.create_faq, ("q", "a")),
+        (admin_db.get_all_faqs, ()),
+        (admin_db.get_faq_by_id, (1,)),
+        (admin_db.delete_faq, (1,)),
+        (admin_db.create_reward, ("r", "d", 1.0, "x")),
+        (admin_db.get_all_rewards, ()),
+        (admin_db.get_reward_by_id, (1,)),
+        (admin_db.delete_reward, (1,)),
+        (admin_db.get_change_version, ("rewards",)),
+        (db.get_change_version, ("projects:Shipped",)),
+        (db.get_changes, (0, 100)),
+        (db.get_change_log_bounds, ()),
+        (db.prune_change_log, (10,)),
+        (db.get_orders_by_ids, ([1, 2, 3],)),
+        (db.iter_export_rows, ("orders", 10, None, 100)),
+        (db.iter_export_rows, ("projects", None, "2000-01-01", 100)),
+        (db.iter_export_rows, ("users", None, None, 100)),
+        (db.get_export_chunk, ("orders", 0, None, 100)),
+    ]
+
+
+def public_functions(module):
+    return {
+        name
+        for name, fn in inspect.getmembers(module, inspect.isfunction)
+        if fn.__module__ == module.__name__ and not name.startswith("_") and name not in SKIP
+    }
+
+
+def plan_problems(conn, sql, allow_temp_btree=False):
+    if not sql.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+        return []
+    problems = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+        detail = row[3]
+        if detail.startswith("SCAN") and "USING" not in detail and "CONSTANT ROW" not in detail:
+            if detail.split()[1] not in SMALL_TABLES:
+                problems.append(detail)
+        elif "USE TEMP B-TREE" in detail and not allow_temp_btree:
+            problems.append(detail)
+    return problems
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    db.DB_NAME = os.path.join(tmp, "users.db")
+    admin_db.ADMIN_DB_NAME = os.path.join(tmp, "admin.db")
+    db.init_db()
+    admin_db.init_db()
+    seed()
+
+    calls = workload()
+    failures = []
+    missing = (public_functions(db) | public_functions(admin_db)) - {fn.__name__ for fn, _ in calls}
+    for name in sorted(missing):
+        failures.append(f"{name}: no workload entry in query_plans.py")
+
+    for fn, args in calls:
+        traced = []
+        for manager in (db._connections, admin_db._connections):
+            manager.connection().set_trace_callback(traced.append)
+        try:
+            result = fn(*args)
+            if inspect.isgenerator(result):
+                for _ in result:
+                    pass
+        finally:
+            for manager in (db._connections, admin_db._connections):
+                manager.connection().set_trace_callback(None)
+        conn = (admin_db if fn.__module__ == "admin_db" else db)._connections.connection()
+        for sql in traced:
+            for problem in plan_problems(conn, sql, fn.__name__ in ALLOW_TEMP_BTREE):
+                failures.append(f"{fn.__module__}.{fn.__name__}: {problem}\n    {' '.join(sql.split())}")
+
+    for failure in failures:
+        print(failure)
+    print(f"{len(calls)} workload calls checked, {len(failures)} problem(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
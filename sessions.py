@@ -0,0 +1,129 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+import cooperative
+import db
+
+# Bump when the payload layout changes; older payloads are reissued from users.db
+SESSION_VERSION = 2
+# How often (seconds) to ask users.db whether another connection has committed
+CHECK_INTERVAL = 1.0
+
+# Every users column callers read; a restored snapshot has the same keys as the row
+# (apart from session_epoch), whether or not this request reissued it
+SNAPSHOT_FIELDS = ("email", "nickname", "slack_id", "hours", "created_at")
+ROLE_ADMIN = 1
+ROLE_REVIEWER = 2
+
+_epochs: Dict[int, int] = {}
+_high = 0
+_lock = threading.Lock()
+_watch = None
+_watch_key = None
+_data_version = None
+_checked_at = 0.0
+_dirty = False
+
+
+def load_secret_key(path: str) -> bytes:
+    # Every worker has to sign with the same key, so the first process to get here
+    # writes one and the rest read it. The key is written in full before it is linked
+    # into place, so readers never see a partial file.
+    try:
+        with open(path, "rb") as f:
+            key = f.read()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(secrets.token_hex(32).encode())
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _poll_data_version() -> int:
+    # Same approach as catalog.py: a private connection that never writes
+    global _watch, _watch_key, _epochs, _high, _data_version
+    key = (os.getpid(), db.DB_NAME)
+    if _watch is None or _watch_key != key:
+        _watch = sqlite3.connect(db.DB_NAME, check_same_thread=False)
+        _watch_key = key
+        _epochs, _high, _data_version = {}, 0, None
+    return _watch.execute("PRAGMA data_version").fetchone()[0]
+
+
+def _refresh(force: bool = False):
+    global _high, _data_version, _checked_at, _dirty
+    with _lock:
+        data_version = cooperative.run(_poll_data_version)
+        if force or _dirty or data_version != _data_version:
+            _dirty = False
+            # Epochs come from one global counter, so only rows past the highest one
+            # seen so far can have moved
+            for user_id, epoch in db.get_session_epochs(_high):
+                _epochs[user_id] = epoch
+                _high = max(_high, epoch)
+            _data_version = data_version
+        _checked_at = time.monotonic()
+
+
+def _mark_dirty(user_id: Optional[int] = None):
+    global _dirty
+    _dirty = True
+
+
+db.user_change_hooks.append(_mark_dirty)
+
+
+def current_epoch(user_id: int, force: bool = False) -> int:
+    if force or _dirty or time.monotonic() - _checked_at >= CHECK_INTERVAL:
+        _refresh(force)
+    return _epochs.get(user_id, 0)
+
+
+def issue(user: Dict[str, Any], roles: int, role_key: str) -> Dict[str, Any]:
+    # Session payload for a users row: the columns pages need, the epoch they were
+    # read at, and the role bits resolved against the config identified by role_key
+    return {
+        "v": SESSION_VERSION,
+        "uid": user["id"],
+        "ep": user.get("session_epoch") or 0,
+        "u": [user.get(field) for field in SNAPSHOT_FIELDS],
+        "r": roles,
+        "rk": role_key,
+    }
+
+
+def snapshot(payload: Dict[str, Any]) -> Dict[str, Any]:
+    user = {"id": payload["uid"]}
+    user.update(zip(SNAPSHOT_FIELDS, payload["u"]))
+    return user
+
+
+def restore(payload) -> Optional[Dict[str, Any]]:
+    # The user snapshot in a payload, or None if the payload has another version or
+    # the row changed after it was issued
+    if not isinstance(payload, dict) or payload.get("v") != SESSION_VERSION:
+        return None
+    user_id, epoch = payload.get("uid"), payload.get("ep")
+    if not isinstance(user_id, int) or not isinstance(epoch, int):
+        return None
+    known = current_epoch(user_id)
+    if epoch > known:
+        # Issued by a process that has seen a newer bump than this one
+        known = current_epoch(user_id, force=True)
+    if epoch != known:
+        return None
+    return snapshot(payload)
@@ -1,11 +1,13 @@
 import os
-import requests
-from typing import Optional, Dict, Any
+import http_client
+from typing import Optional, Dict, Any, List, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
+SLACK_API_URL = os.getenv("SLACK_API_URL", "https://slack.com/api").rstrip("/")
+SHIP_CHANNEL = "C09U5BFU3GA"
 
 
 def format_hours(hours: float) -> str:
@@ -18,58 +20,44 @@ def format_hours(hours: float) -> str:
     return f"{h}h {m}m"
 
 
-def send_dm(user_slack_id: str, blocks: list) -> bool:
+def post_message(channel: str, blocks: list) -> Dict[str, Any]:
     if not SLACK_BOT_TOKEN:
-        print("Error: SLACK_BOT_TOKEN not set")
-        return False
+        return {"ok": False, "error": "SLACK_BOT_TOKEN not set", "retry_after": None}
 
-    url = "https://slack.com/api/chat.postMessage"
+    url = f"{SLACK_API_URL}/chat.postMessage"
     headers = {
         "Authorization": f"Bearer {SLACK_BOT_TOKEN}",
         "Content-Type": "application/json",
     }
 
-    payload = {"channel": user_slack_id, "blocks": blocks}
+    payload = {"channel": channel, "blocks": blocks}
 
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = http_client.post(url, json=payload, headers=headers)
+        if response.status_code == 429:
+            retry_after = float(response.headers.get("Retry-After") or 1)
+            return {"ok": False, "error": "ratelimited", "retry_after": retry_after}
         data = response.json()
-
-        if not data.get("ok"):
-            print(f"Slack API error: {data.get('error')}")
-            return False
-
-        return True
+        return {"ok": bool(data.get("ok")), "error": data.get("error"), "retry_after": None}
     except Exception as e:
-        print(f"Failed to send Slack DM: {e}")
-        return False
-
+        return {"ok": False, "error": str(e), "retry_after": None}
 
-def send_channel_message(channel: str, blocks: list) -> bool:
 
-    url = "https://slack.com/api/chat.postMessage"
-    headers = {
-        "Authorization": f"Bearer {SLACK_BOT_TOKEN}",
-        "Content-Type": "application/json",
-    }
-
-    payload = {"channel": channel, "blocks": blocks}
-
-    try:
-        response = requests.post(url, json=payload, headers=headers)
-        data = response.json()
+def send_dm(user_slack_id: str, blocks: list) -> bool:
+    result = post_message(user_slack_id, blocks)
+    if not result["ok"]:
+        print(f"Failed to send Slack DM: {result['error']}")
+    return result["ok"]
 
-        if not data.get("ok"):
-            print(f"Slack API error: {data.get('error')}")
-            return False
 
-        return True
-    except Exception as e:
-        print(f"Failed to send Slack channel message: {e}")
-        return False
+def send_channel_message(channel: str, blocks: list) -> bool:
+    result = post_message(channel, blocks)
+    if not result["ok"]:
+        print(f"Failed to send Slack channel message: {result['error']}")
+    return result["ok"]
 
 
-def project_shipped(project):
+def project_shipped_messages(project) -> List[Tuple[str, list]]:
     blocks = [
         {
             "type": "context",
@@ -107,7 +95,7 @@ def project_shipped(project):
         },
     ]
 
-    send_dm(project["slack_id"], blocks)
+    messages = [(project.get("slack_id"), blocks)]
 
     blocks = [
         {
@@ -137,10 +125,11 @@ def project_shipped(project):
         },
     ]
 
-    send_channel_message("C09U5BFU3GA", blocks)
+    messages.append((SHIP_CHANNEL, blocks))
+    return messages
 
 
-def project_rejected(project, reason):
+def project_rejected_messages(project, reason) -> List[Tuple[str, list]]:
     blocks = [
         {
             "type": "context",
@@ -167,4 +156,5 @@ def project_rejected(project, reason):
         },
     ]
 
-    send_dm(project["slack_id"], blocks)
+    return [(project.get("slack_id"), blocks)]
+
@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 16384))
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 128 * 1024 * 1024))
+
+# Called with the SQL text of every statement run on a managed connection (see metrics.py)
+statement_hook: Optional[Callable[[str], None]] = None
+
+
+def _trace(sql: str):
+    if statement_hook is not None:
+        statement_hook(sql)
+
+
+# One connection per thread and process; nested transaction() blocks share
+# the outermost block's transaction and only it commits or rolls back.
+class ConnectionManager:
+    def __init__(self, path: Callable[[], str]):
+        self._path = path
+        self._local = threading.local()
+
+    def _configure(self, conn: sqlite3.Connection):
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.set_trace_callback(_trace)
+
+    def connection(self) -> sqlite3.Connection:
+        local = self._local
+        path = self._path()
+        pid = os.getpid()
+        conn = getattr(local, "conn", None)
+        if conn is None or local.pid != pid or local.path != path:
+            conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+            self._configure(conn)
+            local.conn = conn
+            local.pid = pid
+            local.path = path
+            local.depth = 0
+        return conn
+
+    def in_transaction(self) -> bool:
+        return getattr(self._local, "depth", 0) > 0
+
+    @contextmanager
+    def transaction(self, immediate: bool = False):
+        conn = self.connection()
+        local = self._local
+        outermost = local.depth == 0
+        if outermost and immediate and not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        local.depth += 1
+        try:
+            yield conn
+            if outermost:
+                conn.commit()
+        except Exception:
+            if outermost:
+                conn.rollback()
+            raise
+        finally:
+            local.depth -= 1
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -125,6 +125,8 @@ function renderRewards() {
             class="card-img-top rounded-top-3 bg-light"
             alt="${escapeHtml(reward.name)}"
             style="height: 200px; object-fit: contain"
+            loading="lazy"
+            decoding="async"
           />
         </div>
         <div class="card-body d-flex flex-column">
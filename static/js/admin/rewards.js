@@ -55,7 +55,7 @@ function renderSimpleMarkdown(text) {
 
 async function loadRewards() {
   try {
-    const response = await fetch("/api/rewards");
+    const response = await fetch("/api/rewards", { cache: "no-cache" });
     const data = await response.json();
     rewards = data.rewards || [];
     renderRewards();
@@ -100,7 +100,16 @@ function renderRewards() {
           <p class="card-text text-muted small">${escapeHtml(
             reward.description
           )}</p>
-          <div class="mt-auto pt-3 text-end">
+          <div class="mt-auto pt-3 d-flex justify-content-between align-items-center">
+            <button class="btn btn-outline-secondary btn-sm" onclick="editStock(${
+              reward.id
+            })">
+              <i class="bi bi-box-seam me-1"></i>${
+      reward.stock === null || reward.stock === undefined
+        ? "Unlimited"
+        : `${reward.stock} left`
+    }
+            </button>
             <button class="btn btn-outline-danger btn-sm delete-btn" onclick="deleteReward(${
               reward.id
             })">
@@ -125,6 +134,8 @@ async function createReward() {
   const cost = parseFloat(document.getElementById("rewardCost").value);
   const imageUrl = document.getElementById("rewardImage").value.trim();
   const description = document.getElementById("rewardDesc").value.trim();
+  const stockValue = document.getElementById("rewardStock").value.trim();
+  const stock = stockValue === "" ? null : parseInt(stockValue, 10);
 
   if (!name || !cost || !imageUrl || !description) {
     alert("Please fill in all fields");
@@ -136,6 +147,11 @@ async function createReward() {
     return;
   }
 
+  if (stock !== null && (isNaN(stock) || stock < 0)) {
+    alert("Stock must be a non-negative whole number");
+    return;
+  }
+
   saveRewardBtn.disabled = true;
   saveRewardBtn.innerHTML =
     '<span class="spinner-border spinner-border-sm me-2"></span>Adding...';
@@ -144,7 +160,13 @@ async function createReward() {
     const response = await fetch("/api/admin/rewards", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ name, cost, image_url: imageUrl, description }),
+      body: JSON.stringify({
+        name,
+        cost,
+        image_url: imageUrl,
+        description,
+        stock,
+      }),
     });
 
     if (response.ok) {
@@ -164,6 +186,39 @@ async function createReward() {
   }
 }
 
+async function editStock(rewardId) {
+  const reward = rewards.find((r) => r.id === rewardId);
+  const current =
+    reward && reward.stock !== null && reward.stock !== undefined
+      ? String(reward.stock)
+      : "";
+  const value = prompt("Remaining stock (leave empty for unlimited):", current);
+  if (value === null) return;
+  const stock = value.trim() === "" ? null : parseInt(value, 10);
+  if (stock !== null && (isNaN(stock) || stock < 0)) {
+    alert("Stock must be a non-negative whole number");
+    return;
+  }
+
+  try {
+    const response = await fetch(`/api/admin/rewards/${rewardId}/stock`, {
+      method: "PUT",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ stock }),
+    });
+
+    if (response.ok) {
+      await loadRewards();
+    } else {
+      const error = await response.json();
+      alert(error.error || "Failed to update stock");
+    }
+  } catch (error) {
+    console.error("Failed to update stock:", error);
+    alert("Failed to update stock");
+  }
+}
+
 async function deleteReward(rewardId) {
   if (!confirm("Are you sure you want to delete this reward?")) return;
 
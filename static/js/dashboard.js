@@ -112,6 +112,7 @@ async function loadProjects() {
     const projectsResponse = await fetch("/api/projects?me=true");
     const projectsData = await projectsResponse.json();
     projects = projectsData.projects || [];
+    subscribeToChanges(projectsData.change_id);
 
     const hackatimeResponse = await fetch("/api/hackatime");
     const hackatimeData = await hackatimeResponse.json();
@@ -125,6 +126,34 @@ async function loadProjects() {
   }
 }
 
+// Reviews, payouts and hour syncs of the user's projects arrive as /api/events deltas.
+// If the server refuses the stream (503 when it is out of stream slots), reload on a
+// timer instead; each reload tries the stream again.
+const POLL_INTERVAL_MS = 30000;
+let eventSource = null;
+
+function subscribeToChanges(changeId) {
+  if (eventSource || !window.EventSource) return;
+  eventSource = new EventSource(`/api/events?since=${changeId || 0}`);
+  eventSource.addEventListener("project", (e) => {
+    const data = JSON.parse(e.data);
+    if (data.action === "deleted") {
+      projects = projects.filter((p) => p.id !== data.id);
+    } else {
+      const index = projects.findIndex((p) => p.id === data.project.id);
+      if (index >= 0) projects[index] = { ...projects[index], ...data.project };
+      else projects.unshift(data.project);
+    }
+    renderProjects();
+  });
+  eventSource.addEventListener("reset", () => loadProjects());
+  eventSource.onerror = () => {
+    if (eventSource.readyState !== EventSource.CLOSED) return;
+    eventSource = null;
+    setTimeout(loadProjects, POLL_INTERVAL_MS);
+  };
+}
+
 function populateHackatimeDropdowns() {
   createHackatimeList.innerHTML = "";
   hackatimeList.innerHTML = "";
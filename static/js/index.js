@@ -104,6 +104,8 @@ async function loadRewards() {
                                 }"
                                 class="card-img-top rounded-top-3"
                                 style="height: 160px; object-fit: contain"
+                                loading="lazy"
+                                decoding="async"
                                 alt="${reward.name}"
                                 onerror="this.src='https://via.placeholder.com/300x200?text=No+Image'"
                             />
@@ -228,7 +230,9 @@ async function loadShipped() {
     `;
 
   try {
-    const response = await fetch("/api/projects?status=shipped");
+    const response = await fetch(
+      "/api/projects?status=shipped&limit=30&fields=id,title,description,github_link,demo_link"
+    );
     const data = await response.json();
     console.log(data);
 
@@ -2,6 +2,7 @@ let rewards = [];
 const marketGrid = document.getElementById("marketGrid");
 
 let selectedReward = null;
+let orderIdempotencyKey = null;
 const orderModalEl = document.getElementById("orderModal");
 const orderModal = orderModalEl ? new bootstrap.Modal(orderModalEl) : null;
 const orderItemImage = document.getElementById("orderItemImage");
@@ -58,6 +59,8 @@ function renderRewards() {
             class="card-img-top rounded-top-3 bg-light"
             alt="${escapeHtml(reward.name)}"
             style="height: 200px; object-fit: contain"
+            loading="lazy"
+            decoding="async"
           />
         </div>
         <div class="card-body d-flex flex-column">
@@ -66,9 +69,10 @@ function renderRewards() {
             <span class="badge bg-primary">${reward.cost} hour${reward.cost !== 1 ? 's' : ''}</span>
           </div>
           <p class="card-text text-muted small">${escapeHtml(reward.description)}</p>
-          <div class="mt-auto pt-3 text-end">
-            <button class="btn btn-primary order-btn" onclick="orderReward(${reward.id})">
-              <i class="bi bi-cart-plus me-1"></i>ORDER
+          <div class="mt-auto pt-3 d-flex justify-content-between align-items-center">
+            <span class="small text-muted">${stockLabel(reward)}</span>
+            <button class="btn btn-primary order-btn" onclick="orderReward(${reward.id})"${reward.stock === 0 ? " disabled" : ""}>
+              <i class="bi bi-cart-plus me-1"></i>${reward.stock === 0 ? "SOLD OUT" : "ORDER"}
             </button>
           </div>
         </div>
@@ -78,10 +82,22 @@ function renderRewards() {
   });
 }
 
+function stockLabel(reward) {
+  if (reward.stock === null || reward.stock === undefined) return "";
+  return reward.stock === 0 ? "Sold out" : `${reward.stock} left`;
+}
+
+function newIdempotencyKey() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
 function orderReward(rewardId) {
   const reward = rewards.find((r) => r.id === rewardId);
   if (!reward) return;
   selectedReward = reward;
+  // One key per checkout: double-clicks and retries of the same order are deduplicated server-side
+  orderIdempotencyKey = newIdempotencyKey();
   if (orderItemImage) orderItemImage.src = reward.image_url || "";
   if (orderItemName) orderItemName.textContent = reward.name || "";
   if (orderItemDesc) orderItemDesc.textContent = reward.description || "";
@@ -155,7 +171,7 @@ async function submitOrder() {
     try {
       const res = await fetch("/api/orders", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", "Idempotency-Key": orderIdempotencyKey },
         body: JSON.stringify({
           reward_id: selectedReward.id,
           quantity: qty,
@@ -168,7 +184,9 @@ async function submitOrder() {
       if (res.ok) {
         if (orderModal) orderModal.hide();
         alert("Order placed successfully!");
+        loadRewards();
       } else {
+        if (res.status === 409) loadRewards();
         const err = await res.json().catch(() => ({}));
         if (orderError) orderError.textContent = err.error || `Failed to place order (${res.status})`;
       }
@@ -42,7 +42,14 @@ const payInput = document.getElementById("payInput");
 const payBtn = document.getElementById("payBtn");
 const payHelper = document.getElementById("payHelper");
 
+const pendingBulkActions = document.getElementById("pendingBulkActions");
+const shippedBulkActions = document.getElementById("shippedBulkActions");
+const bulkApproveBtn = document.getElementById("bulkApproveBtn");
+const bulkRejectBtn = document.getElementById("bulkRejectBtn");
+const bulkPayBtn = document.getElementById("bulkPayBtn");
+
 let _originalValues = {};
+const selectedIds = new Set();
 
 function getStatusBadge(status) {
   const statusMap = {
@@ -86,11 +93,48 @@ async function loadProjects() {
     const data = await response.json();
     projects = data.projects || [];
     renderProjects();
+    subscribeToChanges(data.change_id);
   } catch (error) {
     console.error("Failed to load projects:", error);
   }
 }
 
+// Live updates: the list is loaded once, then kept current from /api/events deltas,
+// or reloaded every POLL_INTERVAL_MS while the server refuses the stream
+const POLL_INTERVAL_MS = 30000;
+let eventSource = null;
+let renderTimer = null;
+
+function subscribeToChanges(changeId) {
+  if (eventSource || !window.EventSource) return;
+  eventSource = new EventSource(`/api/events?since=${changeId || 0}`);
+  eventSource.addEventListener("project", (e) => applyProjectEvent(JSON.parse(e.data)));
+  eventSource.addEventListener("reset", () => loadProjects());
+  eventSource.onerror = () => {
+    if (eventSource.readyState !== EventSource.CLOSED) return;
+    eventSource = null;
+    setTimeout(loadProjects, POLL_INTERVAL_MS);
+  };
+}
+
+function applyProjectEvent(data) {
+  if (data.action === "deleted") {
+    projects = projects.filter((p) => p.id !== data.id);
+    selectedIds.delete(data.id);
+  } else {
+    const index = projects.findIndex((p) => p.id === data.project.id);
+    if (index >= 0) projects[index] = { ...projects[index], ...data.project };
+    else projects.unshift(data.project);
+  }
+  // Coalesce bursts (e.g. a teammate's bulk approve) into one render
+  if (!renderTimer) {
+    renderTimer = setTimeout(() => {
+      renderTimer = null;
+      renderProjects();
+    }, 100);
+  }
+}
+
 function renderProjects() {
   const pendingTerm = pendingSearchInput.value.trim();
   const shippedTerm = shippedSearchInput.value.trim();
@@ -118,12 +162,31 @@ function renderProjects() {
     building.length !== 1 ? "s" : ""
   }`;
 
-  renderGrid(pendingGrid, pending);
-  renderGrid(shippedGrid, shipped);
+  renderGrid(pendingGrid, pending, true);
+  renderGrid(shippedGrid, shipped, !!shippedBulkActions);
   renderGrid(buildingGrid, building);
+  updateBulkActions();
+}
+
+function selectedIn(status) {
+  return projects.filter((p) => selectedIds.has(p.id) && status.includes(p.status));
 }
 
-function renderGrid(grid, projectList) {
+function updateBulkActions() {
+  const pending = selectedIn(["Pending Review"]).length;
+  const shipped = selectedIn(["Shipped", "Approved"]).length;
+  if (pendingBulkActions) {
+    pendingBulkActions.style.setProperty("display", pending ? "flex" : "none", "important");
+    bulkApproveBtn.textContent = `Approve ${pending} selected`;
+    bulkRejectBtn.textContent = `Reject ${pending} selected`;
+  }
+  if (shippedBulkActions) {
+    shippedBulkActions.style.setProperty("display", shipped ? "block" : "none", "important");
+    bulkPayBtn.textContent = `Pay ${shipped} selected (full cap)`;
+  }
+}
+
+function renderGrid(grid, projectList, selectable = false) {
   grid.innerHTML = "";
 
   if (projectList.length === 0) {
@@ -152,7 +215,14 @@ function renderGrid(grid, projectList) {
       <div class="card h-100 shadow border-0 rounded-3">
         <div class="card-body d-flex flex-column">
           <div class="d-flex justify-content-between align-items-start mb-2">
-            <h5 class="card-title mb-0 text-truncate">${title}</h5>
+            ${
+              selectable
+                ? `<input type="checkbox" class="form-check-input me-2 flex-shrink-0 select-project"${
+                    selectedIds.has(project.id) ? " checked" : ""
+                  } />`
+                : ""
+            }
+            <h5 class="card-title mb-0 text-truncate me-auto">${title}</h5>
             <span class="badge ${statusClass}">${status}</span>
           </div>
           <p class="card-text text-truncate mb-2">${description}</p>
@@ -172,10 +242,23 @@ function renderGrid(grid, projectList) {
     col
       .querySelector("button")
       .addEventListener("click", () => openProjectModal(project));
+    const checkbox = col.querySelector(".select-project");
+    if (checkbox) {
+      checkbox.addEventListener("change", () => {
+        if (checkbox.checked) selectedIds.add(project.id);
+        else selectedIds.delete(project.id);
+        updateBulkActions();
+      });
+    }
     grid.appendChild(col);
   });
 }
 
+// Uploaded images come in thumb/card/full sizes; older and external URLs are used as-is
+function imageVariant(url, variant) {
+  return url.replace(/-(thumb|card|full)\.webp$/, `-${variant}.webp`);
+}
+
 function openProjectModal(project) {
   currentProject = project;
 
@@ -197,7 +280,7 @@ function openProjectModal(project) {
   
   // Handle project image
   if (project.image_url) {
-    projectImageImg.src = project.image_url;
+    projectImageImg.src = imageVariant(project.image_url, "card");
     projectImageSection.style.display = "";
   } else {
     projectImageSection.style.display = "none";
@@ -334,6 +417,72 @@ async function handleReject() {
   }
 }
 
+async function postBulk(url, body) {
+  const response = await fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+  const data = await response.json().catch(() => ({}));
+  if (!response.ok) throw new Error(data.error || `Request failed (${response.status})`);
+  return data;
+}
+
+async function runBulk(button, label, action) {
+  button.disabled = true;
+  button.innerHTML = `<span class="spinner-border spinner-border-sm me-2"></span>${label}...`;
+  try {
+    const data = await action();
+    const skipped = data.skipped || [];
+    if (skipped.length) {
+      alert(`${skipped.length} project(s) were skipped because their status had changed.`);
+    }
+    selectedIds.clear();
+    await loadProjects();
+  } catch (error) {
+    console.error(`${label} failed:`, error);
+    alert(error.message || `${label} failed`);
+  } finally {
+    button.disabled = false;
+    updateBulkActions();
+  }
+}
+
+async function handleBulkApprove() {
+  const ids = selectedIn(["Pending Review"]).map((p) => p.id);
+  if (!ids.length || !confirm(`Approve ${ids.length} project(s)?`)) return;
+  await runBulk(bulkApproveBtn, "Approving", () =>
+    postBulk("/api/reviewer/projects/bulk/approve", { project_ids: ids })
+  );
+}
+
+async function handleBulkReject() {
+  const ids = selectedIn(["Pending Review"]).map((p) => p.id);
+  if (!ids.length) return;
+  const reason = prompt(`Please provide a reason for rejecting ${ids.length} project(s):`);
+  if (reason === null) return;
+  if (!reason.trim()) {
+    alert("Please provide a reason for rejection");
+    return;
+  }
+  await runBulk(bulkRejectBtn, "Rejecting", () =>
+    postBulk("/api/reviewer/projects/bulk/reject", { project_ids: ids, reason: reason.trim() })
+  );
+}
+
+async function handleBulkPay() {
+  const payments = selectedIn(["Shipped", "Approved"]).map((p) => ({
+    project_id: p.id,
+    amount: payoutCap(p.hours),
+  }));
+  if (!payments.length) return;
+  const total = payments.reduce((sum, p) => sum + p.amount, 0);
+  if (!confirm(`Pay ${payments.length} project(s) a total of ${formatHours(total)}?`)) return;
+  await runBulk(bulkPayBtn, "Paying", () =>
+    postBulk("/api/reviewer/projects/bulk/pay", { payments })
+  );
+}
+
 function setupSearch(input, clearBtn) {
   input.addEventListener("input", () => {
     clearBtn.style.display = input.value ? "block" : "none";
@@ -517,4 +666,7 @@ document.addEventListener("DOMContentLoaded", function () {
   if (cancelBtn) cancelBtn.addEventListener("click", handleCancelEdit);
   if (deleteBtn) deleteBtn.addEventListener("click", handleDelete);
   if (payBtn) payBtn.addEventListener("click", handlePay);
+  if (bulkApproveBtn) bulkApproveBtn.addEventListener("click", handleBulkApprove);
+  if (bulkRejectBtn) bulkRejectBtn.addEventListener("click", handleBulkReject);
+  if (bulkPayBtn) bulkPayBtn.addEventListener("click", handleBulkPay);
 });
@@ -0,0 +1,4 @@
+# Production entry point: gunicorn -c gunicorn.conf.py (which loads wsgi:app)
+from app import create_app
+
+app = create_app()